@@ -7,7 +7,21 @@ from __future__ import print_function
 import sys, os
 import codecs
 import re
+import mmap
+import struct
+import array
+import heapq
+import bisect
+import multiprocessing
+import functools
+import tempfile
+import shutil
+import math
 from time import time
+from collections import OrderedDict
+import difflib
+import json
+import random
 
 PY2 = sys.version_info[0] == 2
 PY3 = sys.version_info[0] == 3
@@ -20,7 +34,7 @@ __metadata__ = {
     "type"         : "http://purl.org/dc/dcmitype/Software",
     "language"     : "Python 3.7",
     "created"      : "2020-09-25",
-    "modified"     : "2020-09-30",
+    "modified"     : "2026-10-15",
     "publisher"    : "http://github.com/sderose",
     "license"      : "https://creativecommons.org/licenses/by-sa/3.0/"
 }
@@ -44,15 +58,38 @@ This script makes a valiant if imperfect effort.
 
 * A word is split up when it is not in the dictionary,
 but it can be split at some point such that both resulting parts are.
+Failing that, `multiBreak()` looks for the best split into several words
+(see `--multibreak`).
 
 * Line-breaks are inserted before various bullet characters.
 
 * Whitespace is normalized.
 
+* With `--rejoin`, a word hyphenated at the end of a line is moved to the
+start of the next line (unless that is blank), and the hyphen then gets the
+same treatment as any other. Only one line is held at a time.
+
+Input is read and fixed a line at a time, so files of any size can be
+handled in bounded memory, and output is flushed as it goes.
+
 Lookups are done against a dictionary, and try rudimentary suffix-stripping, ignoring case, etc.
 See below re. the default word-list.
 
 
+==Multiple files==
+
+Use `--jobs N` to fix many files at once, with a pool of N processes.
+The Lexicon is loaded once, before the workers start; where the platform
+can fork, they share it (a compiled dictionary is shared outright, since
+its pages belong to the file). Output still comes out in the order of the
+input files, unless `--oext` is used to write each file's output alongside
+it (for example, `--oext .fixed` writes `foo.txt.fixed`). Without `--oext`,
+each worker writes its file's output to a temporary file, which is then
+copied to stdout (so it needs about as much temporary disk space as the
+output of the files in progress, but little memory). The `-v` cache report
+adds up all the workers' caches.
+
+
 ==Examples==
 
 The result varies depending on the PDF viewer in use.
@@ -297,6 +334,74 @@ the source dictionary considered significant enough to have main entries.
 * It has many archaic terms.
 * It lacks many recent terms.
 
+==Compiled dictionaries==
+
+Loading a text word-list means reading and hashing the whole thing on every
+run. Instead, you can compile it once into a binary sorted string table:
+
+    PdfStupidityFix.py --dictionary /usr/share/dict/words --compile words.psflex
+
+and then pass the compiled file to `--dictionary` (the format is detected
+from its header, so either kind of file works there). A compiled dictionary
+is memory-mapped rather than read, so startup is near zero, and concurrent
+processes using the same file share one copy of it in the OS page cache.
+Lookups are a binary search over the mapped table.
+
+Since real text uses the same few thousand words over and over, `isWord()`
+results are kept in a least-recently-used cache (see `--cacheSize`); `-v`
+reports its hits, misses, and evictions at the end.
+
+With `--expandForms`, the regular inflected forms that `isWord()` would
+otherwise find by suffix-stripping (-s, -es, -ies, -ed, -ing) are added to
+the dictionary when it is loaded, or when it is compiled. Each lookup is then
+a single probe, at the cost of a larger dictionary.
+
+==Word frequencies==
+
+By default all words are equally likely, so the first split that yields two
+words wins. Given `--frequencies` (a tab-separated list whose last two fields
+are a word and a count, such as a unigram list, or
+`OCR_resources/BestLcOCRRules.txt`), each word instead costs its negative log
+probability (counts are add-one smoothed). Then the cheapest split of a
+run-together token wins, as does the cheapest multi-word split; and a hyphen
+between two words is kept if that is more likely than the joined form.
+Frequencies can be compiled in as well, as a count table parallel to the words.
+
+For callers with many strings to check, `areWords(strings)` (or
+`isWordMany()`) returns a list of booleans, doing the lookups in bulk: a set
+intersection for a word-list, or one merge-like pass over the sorted table for
+a compiled dictionary. `multiBreak()` uses this to look up every candidate
+piece of a span at once.
+
+Both kinds of Lexicon also offer `prefixEnds(s)`, which walks along `s` once
+(using the sorted words as an implicit trie) and returns every position
+where the part of `s` so far is a word. Finding candidate split points for a
+run-together token thus takes one walk, plus one lookup for each remainder.
+
+The compiled layout is:
+
+* 8-byte magic "PSFLEX1\\n", then little-endian uint32 flags and word count;
+* the flags bit 0x01 means the inflected forms were added (`--expandForms`),
+and 0x02 that there are frequency counts (`--frequencies`);
+* (count+1) little-endian uint32 offsets into the string area;
+* if there are frequencies, a little-endian uint64 total, then
+(count) little-endian uint32 counts, parallel to the words;
+* the string area: the UTF-8 words, sorted bytewise, with no separators.
+
+
+=Benchmarking=
+
+`--benchmark 10000,100000` generates a corpus of each size (in words) from
+words in the dictionary, damages it with a mix of spaced-out titles,
+hyphens within words, and words run together, and fixes it. It reports the
+dictionary load time, and for each size the words per second, accuracy
+(the fraction of the undamaged words recovered, by diff), and peak RSS.
+The corpora depend only on `--seed` and the dictionary, so runs compare.
+
+To guard against regressions, save a run with `--benchmarkSave base.json`,
+and later pass `--benchmarkBaseline base.json`; the script exits with status 1
+if any size got slower (by more than `--benchmarkTolerance`) or less accurate.
+
 
 =Related commands=
 
@@ -306,7 +411,7 @@ My `Text/wordPartTable.py`.
 =Known bugs and Limitations=
 
 The rule that hyphens are removed if either side is not a word, is not
-sufficient. For example, both "mod" (or at least "Mod") and "els" are in `/usr/share/dict/words`, so "mod-els" won't have the hyphen removed.
+sufficient without `--frequencies`. For example, both "mod" (or at least "Mod") and "els" are in `/usr/share/dict/words`, so "mod-els" won't have the hyphen removed.
 
 Tokens with multiple issues, like "incorporatingmulti-sense" are not fixed.
 
@@ -321,6 +426,12 @@ Misses cases with terminal punctuation (partial fix in).
 
 * 2020-09-25: Written by Steven J. DeRose.
 * 2021-04-14: Add --bullets, --asterisks, --stars.
+* 2026-10-15: Add compiled, memory-mapped dictionaries (--compile).
+Replace recursive multiBreak() search with a bounded Viterbi segmenter.
+Add --jobs, --oext, and --recursive. Stream input; add --rejoin.
+Add isWord() cache and --expandForms. Add --frequencies, --benchmark.
+With --jobs, pass output back through temporary files, and add up the
+workers' cache counts.
 
 
 =To do=
@@ -456,12 +567,47 @@ stars = {
 
 lex = {}
 
+MAX_WORD_LEN = 32           # Longest piece multiBreak() will look up
+SEGMENT_TIME_LIMIT = 0.5    # Seconds multiBreak() may spend on one span
+SEGMENT_BATCH = 256         # Start positions multiBreak() looks up at once
+FLUSH_LINES = 1000          # Flush output this often (in lines)
+
 
 ###############################################################################
 # Load and query a list of words, typically the usual *nix list.
 #
+def regularForms(w):
+    """Generate the inflected forms of `w` that Lexicon.isWord() accepts
+    by suffix-stripping (only lower-case words have them).
+    """
+    if (w != w.lower()): return
+    yield w + "s"
+    yield w + "es"
+    yield w + "ed"
+    yield w + "ing"
+    if (w.endswith("y")): yield w[0:-1] + "ies"
+    if (w.endswith("e")): yield w[0:-1] + "ing"
+
+def readFrequencies(path):
+    """Generate (word, count) pairs from a tab-separated frequency list,
+    taking the last two fields of each line. That handles plain "word count"
+    unigram lists, as well as "error correction count" lists such as
+    `OCR_resources/BestLcOCRRules.txt` (where the count goes to the correction).
+    """
+    with codecs.open(path, "rb", encoding="utf-8") as f:
+        for rec in f:
+            fields = rec.rstrip("\r\n").split("\t")
+            if (len(fields) < 2): continue
+            try:
+                yield fields[-2].strip(), int(fields[-1])
+            except ValueError:
+                continue
+
 class Lexicon(dict):
-    def __init__(self, path, ignoreCase=True):
+    """Maps each word to its frequency count (1 plus any count loaded by
+    loadFrequencies(), so unattested words are smoothed rather than impossible).
+    """
+    def __init__(self, path, ignoreCase=True, cacheSize=0, expandForms=False):
         super(Lexicon, self).__init__()
         self.ignoreCase = ignoreCase
         startTime = time()
@@ -470,54 +616,449 @@ class Lexicon(dict):
                 w = w.strip()
                 if (len(w) == 1): continue
                 self[w] = 1
+        if (expandForms):
+            for w in list(self.keys()):
+                for form in regularForms(w): self[form] = 1
+        self.sortedWords = None  # Built on demand by prefixEnds()
+        self.totalCount = len(self)
+        self.hasFrequencies = False
+        self.initCache(cacheSize, expandForms)
         warn(1, "Loaded %d words from '%s' in %6.4f seconds." %
             (len(self), path, time()-startTime))
 
+    def initCache(self, cacheSize, formsExpanded):
+        """Set up the memo table in front of isWord(). If `formsExpanded`,
+        the regular inflected forms are already entries, so lookups can skip
+        suffix-stripping.
+        """
+        self.formsExpanded = formsExpanded
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict() if (cacheSize > 0) else None
+        self.hits = self.misses = self.evictions = 0
+
+    def cacheCounts(self):
+        return (self.hits, self.misses, self.evictions)
+
+    def addCacheCounts(self, counts):
+        """Add in counts from cacheCounts() (for example, from a worker).
+        """
+        hits, misses, evictions = counts
+        self.hits += hits
+        self.misses += misses
+        self.evictions += evictions
+
+    def cacheStats(self):
+        tries = self.hits + self.misses
+        return ("isWord cache: %d hits, %d misses (%5.1f%% hits), %d evictions." %
+            (self.hits, self.misses, 100.0*self.hits/max(tries, 1), self.evictions))
+
     def isWord(self, w):
         """Check if the word, or a predictably-missing possible variant, is in
         the Lexicon. This over-accepts, because it tries regular endings even
         though they might not be correct. For example, "zebraing" counts.
 
         "" and single characters also count as True.
+
+        Results are memoized (least-recently-used entries are dropped first),
+        since real text asks about the same few thousand tokens over and over.
+        """
+        cache = self.cache
+        if (cache is None): return self.lookUp(w)
+        result = cache.get(w)
+        if (result is not None):
+            self.hits += 1
+            cache.move_to_end(w)
+            return result
+        self.misses += 1
+        result = cache[w] = self.lookUp(w)
+        if (len(cache) > self.cacheSize):
+            cache.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def lookUp(self, w):
+        """Do the actual work for isWord(), without the cache.
+        """
+        return self.entryFor(w) is not None
+
+    def entryFor(self, w):
+        """Return the entry by which `w` counts as a word (`w` itself, its
+        lower-case form, or the stem it was found by suffix-stripping),
+        or None if it doesn't.
         """
         if (len(w)<=1):
-            return True
+            return w
         if (w in self):
-            return True
+            return w
+        for v in self.variants(w):
+            if (v in self): return v
+        return None
+
+    def variants(self, w):
+        """Return the other strings to try for `w`, in order: its lower-case
+        form, then (unless the forms are already in the Lexicon) the stems
+        left by stripping any regular suffix.
+        """
         lw = w.lower()
-        if (lw in self): return True
-        if (lw.endswith("s")   and lw[0:-1] in self):
-            return True
-        if (lw.endswith("es")  and lw[0:-2] in self):
-            return True
-        if (lw.endswith("ies") and (lw[0:-3] + "y") in self):
-            return True
-        if (lw.endswith("ed")  and lw[0:-2] in self):
-            return True
-        if (lw.endswith("ing") and
-            (lw[0:-3] in self or lw[0:-3]+"e" in self)):
-            return True
+        vs = [ lw ]
+        if (self.formsExpanded): return vs
+        if (lw.endswith("s")):   vs.append(lw[0:-1])
+        if (lw.endswith("es")):  vs.append(lw[0:-2])
+        if (lw.endswith("ies")): vs.append(lw[0:-3] + "y")
+        if (lw.endswith("ed")):  vs.append(lw[0:-2])
+        if (lw.endswith("ing")): vs.extend([ lw[0:-3], lw[0:-3] + "e" ])
+        return vs
+
+    def areWords(self, words):
+        """Like isWord(), but for a whole batch of strings at once, returning a
+        list of booleans. Rather than one lookup at a time, this makes just
+        two bulk passes: one for the strings as given, and one for all the
+        variants() of those not found.
+        """
+        words = list(words)
+        uniq = set(words)
+        known = dict.fromkeys(self.present(uniq), True)
+        variantsOf = {}
+        for w in uniq:
+            if (w in known): continue
+            if (len(w) <= 1): known[w] = True
+            else: variantsOf[w] = self.variants(w)
+        allVariants = set()
+        for vs in variantsOf.values(): allVariants.update(vs)
+        found = self.present(allVariants)
+        for w, vs in variantsOf.items():
+            known[w] = any(v in found for v in vs)
+        return [ known[w] for w in words ]
+
+    isWordMany = areWords
+
+    def present(self, batch):
+        """Return the subset of the set `batch` that are entries, in bulk.
+        """
+        return batch & self.keys()
+
+    def loadFrequencies(self, path):
+        """Add the counts from a frequency list (see readFrequencies()) to the
+        matching entries. Words not already in the Lexicon are ignored.
+        """
+        startTime = time()
+        nMatched = 0
+        for w, n in readFrequencies(path):
+            if (w not in self):
+                w = w.lower()
+                if (w not in self): continue
+            self[w] += n
+            nMatched += 1
+        self.totalCount = sum(self.values())
+        self.hasFrequencies = True
+        warn(1, "Loaded %d frequencies from '%s' in %6.4f seconds." %
+            (nMatched, path, time()-startTime))
+
+    def countOf(self, entry):
+        return self.get(entry, 1)
+
+    def allWords(self):
+        return iter(self.keys())
+
+    def count(self, w):
+        """Return the frequency count for `w` via the entry it matches
+        (1 if there's nothing better to go on, or 0 if it's not a word).
+        """
+        entry = self.entryFor(w)
+        if (entry is None): return 0
+        if (len(entry) <= 1): return 1
+        return self.countOf(entry)
+
+    def prefixEnds(self, s):
+        """Return an ascending list of every j (1 <= j <= len(s)) such that
+        isWord(s[:j]) holds, found in a single walk along `s`. This treats the
+        sorted word list as an implicit trie: each step narrows the range of
+        words that have the prefix so far. `s` should already be lower case.
+        """
+        if (not s): return []
+        ends = set([ 1 ])  # Single characters always count
+        lo, hi = 0, len(self)
+        for j in range(1, len(s)+1):
+            prefix = s[0:j]
+            lo, hi, found = self.narrow(prefix, lo, hi)
+            if (lo >= hi): break
+            if (found):
+                ends.add(j)
+            if (self.formsExpanded): continue
+            if (found):
+                if (s.startswith("s", j)): ends.add(j+1)
+                if (s.startswith("es", j) or s.startswith("ed", j)): ends.add(j+2)
+                if (s.startswith("ing", j)): ends.add(j+3)
+            if (s.startswith("ing", j) and self.narrow(prefix+"e", lo, hi)[2]):
+                ends.add(j+3)
+            if (s.startswith("ies", j) and self.narrow(prefix+"y", lo, hi)[2]):
+                ends.add(j+3)
+        return sorted(ends)
+
+    def narrow(self, prefix, lo, hi):
+        """Given the range [lo:hi] of sorted words that includes all those
+        starting with `prefix`, return the (smaller) range of the words that
+        do, plus whether `prefix` itself is one of them.
+        """
+        if (self.sortedWords is None):
+            self.sortedWords = sorted(self.keys())
+        sw = self.sortedWords
+        lo = bisect.bisect_left(sw, prefix, lo, hi)
+        hi = bisect.bisect_left(sw, prefix + chr(0x10FFFF), lo, hi)
+        return lo, hi, (lo < hi and sw[lo] == prefix)
+
+    def wordCost(self, w):
+        """Return the cost (negative log probability) of `w` as a word, for
+        ranking alternative splits and joins. With no frequency information,
+        all words are equally likely, so fewer words means lower cost.
+        """
+        return math.log(max(self.totalCount, 2) / max(self.count(w), 1))
+
+
+###############################################################################
+# A Lexicon compiled to a sorted string table (see "Compiled dictionaries"
+# above), which is memory-mapped instead of read and hashed.
+#
+LEX_MAGIC = b"PSFLEX1\n"
+LEX_HEADER = struct.Struct("<8sII")  # magic, flags, word count
+
+def isCompiledLexicon(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(LEX_MAGIC)) == LEX_MAGIC
+    except IOError:
         return False
 
+LEX_EXPANDED = 0x01     # Flag: regular inflected forms are included
+LEX_FREQUENCIES = 0x02  # Flag: there is a table of frequency counts
+LEX_TOTAL = struct.Struct("<Q")  # Sum of the counts (starts the count table)
+MAX_COUNT = 0xFFFFFFFF
+
+def compileLexicon(srcPath, dstPath, expandForms=False, freqPath=None):
+    """Read a one-word-per-line dictionary, and write it out in the compiled
+    form that MappedLexicon uses. Returns the number of words written.
+    If `expandForms` is set, the regularForms() of each word are included.
+    If `freqPath` is set, load counts from there (see readFrequencies()).
+    """
+    srcLex = Lexicon(srcPath, expandForms=expandForms)
+    if (freqPath): srcLex.loadFrequencies(freqPath)
+    entries = sorted((w.encode("utf-8"), n) for w, n in srcLex.items() if len(w) > 1)
+
+    offsets = array.array("I", [ 0 ])
+    for w, _ in entries: offsets.append(offsets[-1] + len(w))
+    counts = array.array("I", [ min(n, MAX_COUNT) for _, n in entries ])
+    if (sys.byteorder != "little"):
+        offsets.byteswap()
+        counts.byteswap()
+
+    flags = 0
+    if (expandForms): flags |= LEX_EXPANDED
+    if (freqPath): flags |= LEX_FREQUENCIES
+    with open(dstPath, "wb") as f:
+        f.write(LEX_HEADER.pack(LEX_MAGIC, flags, len(entries)))
+        f.write(offsets.tobytes())
+        if (freqPath):
+            f.write(LEX_TOTAL.pack(sum(n for _, n in entries)))
+            f.write(counts.tobytes())
+        for w, _ in entries: f.write(w)
+    return len(entries)
+
+def openLexicon(path, ignoreCase=True, cacheSize=0, expandForms=False,
+    freqPath=None):
+    """Return a Lexicon for a word-list or a compiled dictionary, as appropriate.
+    (`expandForms` and `freqPath` only apply to word-lists; compiled
+    dictionaries have them or not, as set when they were compiled).
+    """
+    if (isCompiledLexicon(path)):
+        theLex = MappedLexicon(path, ignoreCase=ignoreCase, cacheSize=cacheSize)
+    else:
+        theLex = Lexicon(path, ignoreCase=ignoreCase,
+            cacheSize=cacheSize, expandForms=expandForms)
+    if (freqPath): theLex.loadFrequencies(freqPath)
+    return theLex
+
+class MappedLexicon(Lexicon):
+    """Like Lexicon, but queries a compiled dictionary file directly via mmap,
+    by binary search. Nothing is actually stored in the dict itself.
+    """
+    def __init__(self, path, ignoreCase=True, cacheSize=0):
+        dict.__init__(self)
+        self.ignoreCase = ignoreCase
+        startTime = time()
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.flags, self.nWords = LEX_HEADER.unpack_from(self.mm, 0)
+        if (magic != LEX_MAGIC):
+            raise ValueError("'%s' is not a compiled dictionary." % (path))
+        pos = LEX_HEADER.size
+        self.offsets = self.uint32Table(pos, self.nWords + 1)
+        pos += 4 * (self.nWords + 1)
+        self.counts = None
+        self.totalCount = self.nWords
+        self.hasFrequencies = bool(self.flags & LEX_FREQUENCIES)
+        if (self.hasFrequencies):
+            self.totalCount = LEX_TOTAL.unpack_from(self.mm, pos)[0]
+            pos += LEX_TOTAL.size
+            self.counts = self.uint32Table(pos, self.nWords)
+            pos += 4 * self.nWords
+        self.strStart = pos
+        self.initCache(cacheSize, bool(self.flags & LEX_EXPANDED))
+        warn(1, "Mapped %d words from '%s' in %6.4f seconds." %
+            (self.nWords, path, time()-startTime))
+
+    def uint32Table(self, start, n):
+        """Return a sequence of `n` little-endian uint32s at `start` in the file
+        (a view of the mapped file itself, where byte order permits).
+        """
+        view = memoryview(self.mm)[start:start+4*n]
+        if (sys.byteorder == "little"): return view.cast("I")
+        table = array.array("I", view.tobytes())
+        table.byteswap()
+        view.release()
+        return table
+
+    def __len__(self):
+        return self.nWords
+
+    def __contains__(self, w):
+        return self.indexOf(w) >= 0
+
+    def indexOf(self, w):
+        """Return the position of `w` in the table, or -1 if it's not there.
+        """
+        bw = w.encode("utf-8")
+        mm = self.mm
+        offs = self.offsets
+        base = self.strStart
+        lo, hi = 0, self.nWords
+        while (lo < hi):
+            mid = (lo + hi) >> 1
+            cand = mm[base+offs[mid]:base+offs[mid+1]]
+            if (cand < bw): lo = mid + 1
+            elif (cand > bw): hi = mid
+            else: return mid
+        return -1
+
+    def allWords(self):
+        for i in range(self.nWords):
+            yield self.wordAt(i).decode("utf-8")
+
+    def present(self, batch):
+        """Look up a batch of strings in one merge-like pass: sorted, each one
+        only needs to be sought in the part of the table past the previous.
+        """
+        found = set()
+        lo = 0
+        for bw, w in sorted((w.encode("utf-8"), w) for w in batch):
+            lo = self.bisectLeft(bw, lo, self.nWords)
+            if (lo >= self.nWords): break
+            if (self.wordAt(lo) == bw): found.add(w)
+        return found
+
+    def countOf(self, entry):
+        if (self.counts is None): return 1
+        i = self.indexOf(entry)
+        return self.counts[i] if (i >= 0) else 1
+
+    def loadFrequencies(self, path):
+        warn(0, "Cannot add frequencies to a compiled dictionary; "
+            "compile it with --frequencies instead.")
+
+    def narrow(self, prefix, lo, hi):
+        bPrefix = prefix.encode("utf-8")
+        lo = self.bisectLeft(bPrefix, lo, hi)
+        hi = self.bisectLeft(bPrefix + b"\xFF", lo, hi)  # 0xFF is never UTF-8
+        return lo, hi, (lo < hi and self.wordAt(lo) == bPrefix)
+
+    def wordAt(self, i):
+        """Return the i-th word of the table, as UTF-8 bytes.
+        """
+        base = self.strStart
+        return self.mm[base+self.offsets[i]:base+self.offsets[i+1]]
+
+    def bisectLeft(self, bw, lo, hi):
+        mm = self.mm
+        offs = self.offsets
+        base = self.strStart
+        while (lo < hi):
+            mid = (lo + hi) >> 1
+            if (mm[base+offs[mid]:base+offs[mid+1]] < bw): lo = mid + 1
+            else: hi = mid
+        return lo
+
 
 ###############################################################################
 #
 def doAllFiles(pathlist):
+    paths = findFiles(pathlist)
+    if (args.jobs <= 1):
+        for path in paths: fixOneFile(path)
+        return
+
+    # Workers inherit the Lexicon when they can be forked (copy-on-write,
+    # or shared pages if it is compiled); otherwise _initWorker() opens it.
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
+    outDir = tempfile.mkdtemp(prefix="psf-")
+    try:
+        with ctx.Pool(args.jobs, initializer=_initWorker,
+            initargs=(args, listMarkers)) as pool:
+            fixer = functools.partial(fixOneFile, outDir=outDir)
+            for outPath, counts in pool.imap(fixer, paths):  # In input order
+                lex.addCacheCounts(counts)
+                if (not outPath): continue
+                with codecs.open(outPath, "rb", encoding="utf-8") as rfh:
+                    shutil.copyfileobj(rfh, sys.stdout)
+                os.remove(outPath)
+    finally:
+        shutil.rmtree(outDir, ignore_errors=True)
+
+def findFiles(pathlist):
+    """Generate the files to process, descending into directories if
+    --recursive is set.
+    """
     for path in pathlist:
         if (os.path.isdir(path)):
             if (not args.recursive): continue
-            children = os.listdir(path)
-            for ch in children:
-                doAllFiles(ch)
+            children = sorted(os.listdir(path))
+            for f in findFiles([ os.path.join(path, ch) for ch in children ]):
+                yield f
         else:
-            doOneFile(path)
-
-def closeup(mat):
-    return re.sub(" ", "", mat.group(1))
+            yield path
+
+def _initWorker(args0, listMarkers0):
+    global args, lex, listMarkers, tokenExpr
+    args = args0
+    listMarkers = listMarkers0
+    tokenExpr = makeTokenExpr(listMarkers)
+    if (not isinstance(lex, Lexicon)):
+        lex = openLexicon(args.dictionary, cacheSize=args.cacheSize,
+            expandForms=args.expandForms, freqPath=args.frequencies)
+
+def fixOneFile(path, outDir=None):
+    """Fix one file, writing the result to path+--oext if that is set, or
+    else to stdout if there's no `outDir`, or else (for --jobs) to a new
+    temporary file in `outDir`, so the parent can copy the results out in
+    order without holding them in memory. Return the temporary file's path
+    (or None), and the isWord() cache counts for just this file.
+    """
+    before = lex.cacheCounts()
+    outPath = None
+    if (args.oext):
+        with codecs.open(path+args.oext, "wb", encoding=args.iencoding) as ofh:
+            doOneFile(path, ofh)
+    elif (outDir is None):
+        doOneFile(path)
+    else:
+        fd, outPath = tempfile.mkstemp(prefix="psf-", suffix=".out", dir=outDir)
+        with open(fd, "w", encoding="utf-8") as ofh:
+            doOneFile(path, ofh)
+    return outPath, [ n - b for n, b in zip(lex.cacheCounts(), before) ]
 
-def doOneFile(path):
+def doOneFile(path, ofh=None):
     """Read and deal with one individual file.
     """
+    if (ofh is None): ofh = sys.stdout
     if (not path):
         if (sys.stdin.isatty()): print("Waiting on STDIN...")
         fh = sys.stdin
@@ -525,101 +1066,277 @@ def doOneFile(path):
         try:
             fh = codecs.open(path, "rb", encoding=args.iencoding)
         except IOError as e:
-            sys.stderr.write("Cannot open '%s':\n    %s" %
-                (e), stat="readError")
+            warn(0, "Cannot open '%s':\n    %s" % (path, e))
             return 0
 
-    for rec in fh.readlines():
-        buf = ""
-        rec = re.sub(r"\b((\w ){4,})", closeUp, rec)  # Spaced-out titles
-        tokens = re.split(r"([-\w]+)", rec)
-        warn(2, "Tokens: %s" % ("|".join(tokens)))
-        for token in tokens:
-            if (not re.match(r"\w", token)):          # punct, space, etc.
-                buf += token
-                continue
-            if (token.isupper()):                     # Acronym
-                buf += token
+    # Stream line by line. With --rejoin, a word fragment ending a line with a
+    # hyphen is held back (along with the rest of its line), and prefixed to
+    # the next line so that fixLine() can decide whether to join it (as for
+    # any other hyphenated token). If there's no next line to join it to,
+    # it goes back where it was.
+    carry = ""
+    held = ""
+    for recnum, rec in enumerate(fh):
+        rec = rec.rstrip("\r\n")
+        if (carry):
+            if (rec.strip()):
+                if (held.strip()): ofh.write(fixLine(held) + "\n")
+                rec = carry + rec.lstrip()
+            else:                                     # Paragraph break
+                ofh.write(fixLine(unsplit(held, carry)) + "\n")
+            carry = held = ""
+        if (args.rejoin):
+            mat = lineEndHyphenExpr.search(rec)
+            if (mat):
+                carry = mat.group(1)
+                held = rec[0:mat.start()].rstrip()
                 continue
+        ofh.write(fixLine(rec) + "\n")
+        if (recnum % FLUSH_LINES == 0): ofh.flush()
+    if (carry): ofh.write(fixLine(unsplit(held, carry)) + "\n")
+    ofh.flush()
 
-            lToken = token.lower()
-            lToken2 = re.sub(r"\W*(.*?)\W*$", "\\1", lToken) # shouldn't be needed.
-
-            if (token in listMarkers):                # List item?
-                token = "\n" + token
-
-            elif ("-" in token):                      # Hyphenated
-                warn(2, "hyphen: '%s'" % (token))
-                mat = re.match(r"(.*)-(.*)", token)
-                if (lex.isWord(mat.group(1)+mat.group(2))):
-                    token = mat.group(1)+mat.group(2)
-                elif (not lex.isWord(mat.group(1)) or
-                    not lex.isWord(mat.group(2))):
-                    token = mat.group(1) + " " + mat.group(2)
-
-            elif (not lex.isWord(lToken2)):           # Mystery word
-                warn(2, "non-word: '%s' (->'%s')" % (lToken, lToken2))
-                for j in range(1, len(lToken)):
-                    p1 = lToken[0:j]
-                    p2 = lToken[j:]
-                    if (lex.isWord(p1) and lex.isWord(p2)):
-                        #token = re.sub(r"(\W*)(.*?)(\W*)$", "\\1"+p1+" "+p2+"\\2", token)
-                        token = token[0:j] + " " + token[j:]
-                        break
-                # TODO: Add multiBreak()
-
-            buf += token
-        print(re.sub(r"\s\s+", " ", buf))
+def unsplit(held, carry):
+    """Put a held-back fragment back on the end of its line.
+    """
+    return (held + " " + carry) if (held.strip()) else carry
+
+spacedTitleExpr = re.compile(r"\b((\w ){4,})")
+spacedCharExpr = re.compile(r"(\S) ")
+multiSpaceExpr = re.compile(r"\s\s+")
+lineEndHyphenExpr = re.compile(r"(\w+-)\s*$")
+
+def makeTokenExpr(markers):
+    """Compile the scanner fixLine() uses to split and classify tokens in one
+    pass. Each match sets exactly one of these groups:
+        marker: one of the given list-marker characters;
+        punct:  other non-word characters (or a token starting with "-");
+        word:   letters, digits, and hyphens (starting with a word character).
+    """
+    markerChars = "".join(re.escape(c) for c in sorted(markers))
+    if (markerChars):
+        expr = r"(?P<marker>[%s])|(?P<punct>[^-\w%s]+|-[-\w]*)|(?P<word>\w[-\w]*)" % (
+            markerChars, markerChars)
+    else:
+        expr = r"(?P<punct>[^-\w]+|-[-\w]*)|(?P<word>\w[-\w]*)"
+    return re.compile(expr)
+
+tokenExpr = makeTokenExpr({})
 
 def closeUp(mat):
-    return re.sub(r"(\S) ", "\\1", mat.group(1))
+    return spacedCharExpr.sub("\\1", mat.group(1))
 
-def multiBreak(s):
-    """Try to break a spaceless span into many words.
-    This is O(n**2) on sLen, but at least not O(2**n).
+def fixLine(rec):
+    """Fix up spacing, hyphenation, and list markers in one line of text,
+    and return the result.
     """
-    # Find all the words that are in there anywhere.
-    # Save as a list by start-points, each mapped to a
-    # list of end-points that make up whole words.
-    warning(0, s)
-    warning(0, "0----+----1----+----2----+----3----+----4----+----5----+----6----")
-    byStarts = []
+    lines = []
+    buf = []
+    rec = spacedTitleExpr.sub(closeUp, rec)           # Spaced-out titles
+    for mat in tokenExpr.finditer(rec):
+        token = mat.group()
+        kind = mat.lastgroup
+        if (args.verbose >= 2): warn(2, "%-6s '%s'" % (kind, token))
+        if (kind == "punct"):                         # punct, space, etc.
+            buf.append(token)
+        elif (kind == "marker"):                      # List item
+            lines.append(multiSpaceExpr.sub(" ", "".join(buf)).rstrip())
+            buf = [ token ]
+        elif (token.isupper()):                       # Acronym
+            buf.append(token)
+        elif ("-" in token):                          # Hyphenated
+            part1, _, part2 = token.rpartition("-")
+            if (lex.isWord(part1+part2)):
+                if (lex.hasFrequencies and lex.isWord(part1) and
+                    lex.isWord(part2) and lex.wordCost(part1+part2) >
+                    lex.wordCost(part1) + lex.wordCost(part2)):
+                    buf.append(token)                 # Likelier a compound
+                else:
+                    buf.append(part1+part2)
+            elif (not lex.isWord(part1) or not lex.isWord(part2)):
+                buf.append(part1 + " " + part2)
+            else:
+                buf.append(token)
+        else:
+            lToken = token.lower()
+            if (not lex.isWord(lToken)):              # Mystery word
+                warn(2, "non-word: '%s'" % (lToken))
+                bestCost, bestJ = None, None
+                for j in lex.prefixEnds(lToken):
+                    if (j < len(lToken) and lex.isWord(lToken[j:])):
+                        if (not lex.hasFrequencies):  # Take the first
+                            bestJ = j
+                            break
+                        cost = lex.wordCost(lToken[0:j]) + lex.wordCost(lToken[j:])
+                        if (bestCost is None or cost < bestCost):
+                            bestCost, bestJ = cost, j
+                if (bestJ is not None):
+                    token = token[0:bestJ] + " " + token[bestJ:]
+                else:
+                    segs = multiBreak(token)
+                    if (segs): token = " ".join(segs[0][1])
+            buf.append(token)
+    lines.append(multiSpaceExpr.sub(" ", "".join(buf)))
+    return "\n".join(lines)
+
+def multiBreak(s, topK=1, maxWordLen=None, timeLimit=None):
+    """Try to break a spaceless span into many words, by dynamic programming
+    (Viterbi) over a lattice of the dictionary words found in it.
+    Each word costs lex.wordCost(); the cheapest complete path(s) win.
+    This is O(len(s) * maxWordLen * topK).
+
+    Returns a list of up to topK (cost, [words]) pairs, best first;
+    or [] if there is no complete split, or if it takes over timeLimit seconds.
+    """
+    if (maxWordLen is None): maxWordLen = MAX_WORD_LEN
+    if (timeLimit is None): timeLimit = SEGMENT_TIME_LIMIT
+    deadline = time() + timeLimit
     sLen = len(s)
-    for i in range(sLen):
-        byStarts.append([])
-        for j in range(i+1, sLen):
-            piece = s[i:j]
-            if (len(piece)==1 and piece not in 'aAiI'): continue
-            if (lex.isWord(piece) or piece.isdigit() or piece.ispunct()):
-                byStarts[i].append(j)
-
-    for i in range(sLen):
-        bs = byStarts[i]
-        buf = "From %2d:  " % (i)
-        for j in bs:
-            buf += "%d:'%s' " % (j, s[i:j])
-        warning(0, buf)
-
-    findCompleteChainsStartingAt(s, byStarts, st=0)
-
-solutions = []
-def findCompleteChainsStartingAt(s, byStarts:list, st:int, soFar:str=""):
-    startHere = byStarts[st]
-    if (len(startHere) == 0):
-        warning(0, "FAIL")
+
+    # Find all the words that are in there anywhere, as a list by end-points,
+    # each mapped to a list of (start-point, cost) for the words ending there.
+    # The candidate pieces are looked up in batches (SEGMENT_BATCH start
+    # positions at a time), checking the time limit between batches.
+    byEnds = [ [] for j in range(sLen+1) ]
+    for batchStart in range(0, sLen, SEGMENT_BATCH):
+        if (time() > deadline):
+            warn(1, "multiBreak: Time limit exceeded for '%s'." % (s[0:80]))
+            return []
+        spans = []
+        for i in range(batchStart, min(sLen, batchStart+SEGMENT_BATCH)):
+            for j in range(i+1, min(sLen, i+maxWordLen)+1):
+                if (j-i == 1 and s[i] not in "aAiI" and not s[i].isdigit()):
+                    continue
+                spans.append((i, j))
+        pieces = [ s[i:j] for i, j in spans ]
+        for (i, j), piece, ok in zip(spans, pieces, lex.areWords(pieces)):
+            if (ok or piece.isdigit()):
+                byEnds[j].append((i, lex.wordCost(piece)))
+
+    # best[j] is a list of up to topK (cost, start, rank) for paths to j,
+    # where rank is the index into best[start] of the path's previous step.
+    best = [ [ (0.0, None, None) ] ]
+    for j in range(1, sLen+1):
+        if (j % SEGMENT_BATCH == 0 and time() > deadline):
+            warn(1, "multiBreak: Time limit exceeded for '%s'." % (s[0:80]))
+            return []
+        cands = []
+        for i, wCost in byEnds[j]:
+            for rank, prev in enumerate(best[i]):
+                cands.append((prev[0] + wCost, i, rank))
+        best.append(heapq.nsmallest(topK, cands))
+
+    results = []
+    for path in best[sLen]:
+        words = []
+        j, step = sLen, path
+        while (step[1] is not None):
+            words.insert(0, s[step[1]:j])
+            j = step[1]
+            step = best[j][step[2]]
+        results.append((path[0], words))
+    if (args.verbose >= 2):
+        for cost, words in results:
+            warn(2, "multiBreak: %8.3f %s" % (cost, " ".join(words)))
+    return results
+
+
+###############################################################################
+# Benchmark and regression harness (see "Benchmarking" above).
+#
+def makeCorpus(nTokens, seed=1):
+    """Generate about `nTokens` words of damaged text, plus the gold (correct)
+    version, as parallel lists of lines. Words come from the Lexicon; the
+    damage is a mix of spaced-out titles, hyphens inserted within words, and
+    adjacent words run together.
+    """
+    rng = random.Random(seed)
+    vocab = [ w for w in lex.allWords()
+        if (3 <= len(w) <= 12 and w.isalpha() and w.islower()) ]
+    vocab.sort()  # So the corpus depends only on the seed
+    damaged, gold = [], []
+    n = 0
+    while (n < nTokens):
+        if (rng.random() < 0.05):                     # Spaced-out title
+            ws = [ rng.choice(vocab).upper() for i in range(rng.randint(1, 3)) ]
+            damaged.append("  ".join(" ".join(w) for w in ws))
+            gold.append(" ".join(ws))
+            n += len(ws)
+            continue
+        ws = [ rng.choice(vocab) for i in range(rng.randint(8, 14)) ]
+        gold.append(" ".join(ws))
+        n += len(ws)
+        out = []
+        i = 0
+        while (i < len(ws)):
+            r = rng.random()
+            if (r < 0.10 and i+1 < len(ws)):          # Run-together
+                out.append(ws[i] + ws[i+1])
+                i += 2
+                continue
+            if (r < 0.20 and len(ws[i]) >= 4):         # Hyphenated
+                k = rng.randint(2, len(ws[i])-2)
+                out.append(ws[i][0:k] + "-" + ws[i][k:])
+            else:
+                out.append(ws[i])
+            i += 1
+        damaged.append(" ".join(out))
+    return damaged, gold
+
+def peakRSS():
+    """Return this process's peak resident set size in KB (None if unknown).
+    """
+    try:
+        import resource
+    except ImportError:
         return None
-    for en in reversed(startHere):
-        thisToken = s[st:en]
-        farther = soFar + " " + thisToken
-        warning(0, farther)
-        #warning(0, "%s[%2d:%2d]: '%s'" % ("    " * depth, st, en, s[st:en]))
-        if (en >= len(s)):
-            solutions.append(farther)
-            warning(0, "Ding: %s" % (farther))
-        else:
-            findCompleteChainsStartingAt(
-                s, byStarts, st=en, soFar=farther)
-    return None  # TODO
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if (sys.platform == "darwin"): rss //= 1024  # Bytes there, KB elsewhere
+    return rss
+
+def runBenchmark(sizes, seed=1):
+    """Fix a generated corpus of each size (in words), and return a list of
+    dicts with the speed, accuracy against the gold text, and memory used.
+    """
+    results = []
+    for size in sizes:
+        damaged, gold = makeCorpus(size, seed=seed)
+        lex.initCache(lex.cacheSize, lex.formsExpanded)
+        startTime = time()
+        fixed = [ fixLine(rec) for rec in damaged ]
+        elapsed = max(time() - startTime, 1e-9)
+
+        nGold = nRight = 0
+        for g, f in zip(gold, fixed):
+            gw, fw = g.split(), f.split()
+            nGold += len(gw)
+            blocks = difflib.SequenceMatcher(None, gw, fw, autojunk=False)
+            nRight += sum(b.size for b in blocks.get_matching_blocks())
+        results.append({
+            "size":         size,
+            "seconds":      elapsed,
+            "tokensPerSec": nGold / elapsed,
+            "accuracy":     nRight / max(nGold, 1),
+            "peakRSSKB":    peakRSS(),
+        })
+    return results
+
+def compareBenchmarks(results, baseline, tolerance):
+    """Return a list of messages for each result that is slower (by more
+    than the `tolerance` fraction) or less accurate than the `baseline`.
+    """
+    problems = []
+    oldBySize = dict((r["size"], r) for r in baseline["results"])
+    for r in results:
+        old = oldBySize.get(r["size"])
+        if (old is None): continue
+        if (r["tokensPerSec"] < old["tokensPerSec"] * (1.0 - tolerance)):
+            problems.append("size %d: %.0f tokens/sec, was %.0f." %
+                (r["size"], r["tokensPerSec"], old["tokensPerSec"]))
+        if (r["accuracy"] < old["accuracy"] - 0.0005):
+            problems.append("size %d: accuracy %.4f, was %.4f." %
+                (r["size"], r["accuracy"], old["accuracy"]))
+    return problems
 
 
 ###############################################################################
@@ -653,22 +1370,69 @@ if __name__ == "__main__":
         parser.add_argument(
             "--asterisks", action="store_true",
             help="Break before various asterisk characters.")
+        parser.add_argument(
+            "--benchmark", type=str, metavar="SIZES",
+            help="Fix generated corpora of these sizes (comma-separated "
+            "word counts), and report speed, accuracy, and memory.")
+        parser.add_argument(
+            "--benchmarkBaseline", type=str, metavar="PATH",
+            help="Compare --benchmark results to those saved here, and "
+            "exit with status 1 on any regression.")
+        parser.add_argument(
+            "--benchmarkSave", type=str, metavar="PATH",
+            help="Save --benchmark results here (as JSON).")
+        parser.add_argument(
+            "--benchmarkTolerance", type=float, metavar="F", default=0.10,
+            help="Fractional slow-down that counts as a regression. Default: 0.10.")
         parser.add_argument(
             "--bullets", action="store_true",
             help="Break before various bullet characters.")
+        parser.add_argument(
+            "--cacheSize", type=int, metavar="N", default=50000,
+            help="Remember up to N recent isWord() results (0 to disable). "
+            "Default: 50000.")
+        parser.add_argument(
+            "--compile", type=str, metavar="PATH",
+            help="Compile the --dictionary word-list to PATH, then exit.")
         parser.add_argument(
             "--dictionary", type=str, metavar="D",
             default="/usr/share/dict/words",
-            help="Dictionary to use.")
+            help="Dictionary to use (word-list or compiled). "
+            "Default: /usr/share/dict/words.")
+        parser.add_argument(
+            "--expandForms", action="store_true",
+            help="Add the regular inflected forms to the dictionary at load "
+            "(or --compile) time, instead of suffix-stripping at lookup time.")
+        parser.add_argument(
+            "--frequencies", type=str, metavar="PATH",
+            help="Load word frequencies from this tab-separated list, to rank "
+            "alternative splits and joins (see also --compile).")
         parser.add_argument(
             "--iencoding", type=str, metavar="E", default="utf-8",
             help="Assume this character set for input files. Default: utf-8.")
+        parser.add_argument(
+            "--jobs", "-j", type=int, metavar="N", default=1,
+            help="Process files using a pool of N processes (see "
+            "'Multiple files'). Default: 1.")
         parser.add_argument(
             "--multibreak", action="store_true",
-            help="Test multi-word breaking algorithm.")
+            help="Show the best few multi-word breaks of a sample string.")
+        parser.add_argument(
+            "--oext", type=str, metavar="EXT",
+            help="Write each file's output to its path plus EXT, "
+            "instead of to stdout.")
         parser.add_argument(
             "--quiet", "-q", action="store_true",
             help="Suppress most messages.")
+        parser.add_argument(
+            "--recursive", "-r", action="store_true",
+            help="Descend into directories.")
+        parser.add_argument(
+            "--rejoin", action="store_true",
+            help="Rejoin words hyphenated across line breaks.")
+        parser.add_argument(
+            "--seed", type=int, metavar="N", default=1,
+            help="Random seed for --benchmark corpora. Default: 1.")
         parser.add_argument(
             "--stars", action="store_true",
             help="Break before various star characters..")
@@ -700,12 +1464,46 @@ if __name__ == "__main__":
     if (args.bullets): listMarkers.update(bullets)
     if (args.asterisks): listMarkers.update(asterisks)
     if (args.stars): listMarkers.update(stars)
+    tokenExpr = makeTokenExpr(listMarkers)
 
-    lex = Lexicon(args.dictionary)
+    if (args.compile):
+        n = compileLexicon(args.dictionary, args.compile,
+            expandForms=args.expandForms, freqPath=args.frequencies)
+        warn(0, "Compiled %d words from '%s' to '%s'." %
+            (n, args.dictionary, args.compile))
+        sys.exit()
+
+    lexStartTime = time()
+    lex = openLexicon(args.dictionary, cacheSize=args.cacheSize,
+        expandForms=args.expandForms, freqPath=args.frequencies)
+    lexLoadTime = time() - lexStartTime
+
+    if (args.benchmark):
+        results0 = runBenchmark(
+            [ int(x) for x in args.benchmark.split(",") ], seed=args.seed)
+        print("Lexicon load: %.4f seconds." % (lexLoadTime))
+        print("%10s %9s %12s %9s %10s" %
+            ("words", "seconds", "tokens/sec", "accuracy", "peakRSS KB"))
+        for r0 in results0:
+            print("%10d %9.3f %12.0f %9.4f %10s" % (r0["size"], r0["seconds"],
+                r0["tokensPerSec"], r0["accuracy"], r0["peakRSSKB"]))
+        if (args.benchmarkSave):
+            with codecs.open(args.benchmarkSave, "wb", encoding="utf-8") as bf:
+                json.dump({ "dictionary": args.dictionary, "seed": args.seed,
+                    "lexiconLoadTime": lexLoadTime, "results": results0 },
+                    bf, indent=2)
+        if (args.benchmarkBaseline):
+            with codecs.open(args.benchmarkBaseline, "rb", encoding="utf-8") as bf:
+                problems0 = compareBenchmarks(results0, json.load(bf),
+                    args.benchmarkTolerance)
+            for msg0 in problems0: warn(0, "Regression: " + msg0)
+            if (problems0): sys.exit(1)
+        sys.exit()
 
     if (args.multibreak):
         sample = "Thepresentdescriptionmaymakeuseofwhatever"
-        multiBreak(sample)
+        for cost0, words0 in multiBreak(sample, topK=5):
+            print("%8.3f  %s" % (cost0, " ".join(words0)))
         sys.exit()
 
     if (args.test):
@@ -720,3 +1518,6 @@ if __name__ == "__main__":
         doOneFile(None)
     else:
         doAllFiles(args.files)
+
+    if (lex.cache is not None):
+        warn(1, lex.cacheStats())
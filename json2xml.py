@@ -7,8 +7,12 @@ from __future__ import print_function
 import sys
 import os
 import re
+import math
 import codecs
+import struct
 import json
+import itertools
+import multiprocessing
 #import pyxser  # https://sourceforge.net/projects/pyxser/
 
 from PowerWalk import PowerWalk, PWType
@@ -22,7 +26,7 @@ __metadata__ = {
     'type'         : "http://purl.org/dc/dcmitype/Software",
     'language'     : "Python 3.7",
     'created'      : "2012-12-04",
-    'modified'     : "2020-20-09",
+    'modified'     : "2026-10-15",
     'publisher'    : "http://github.com/sderose",
     'license'      : "https://creativecommons.org/licenses/by-sa/3.0/"
 }
@@ -41,7 +45,11 @@ distinction which comes naturally to JSON, but
 You can run this from the command line
 to load and convert a JSON file(s). Or you can use this from Python code
 by calling `serialize2xml()` on most any Python object (whether it came from
-JSON or not).
+JSON or not). Other types can be given their own XML form via
+`registerXmlHandler()`. `serialize2xml()` returns the XML as one string; for large data, use
+`writeXml(pyObject, fh)` to write it to a file as it is generated (or
+`iterXml()` to get it as a series of strings), so memory use depends only on
+how deeply the data is nested, not how big it is.
 
 By default, it converts (losslessly, I hope) from JSON to XML. But use the
 `--oformat` option to choose other output formats (specifying `--oformat json`
@@ -108,8 +116,8 @@ becomes (by default) this:
             <ditem key="atom09"><u>token</u></ditem>
             <ditem key="atom10"><u>a
 bc	 </u></ditem>
-            <ditem key="atom11"><u> &lt; &amp; ]]> "
-         </u></ditem>
+            <ditem key="atom11"><u> &lt; &amp; ]]&gt; "
+ &#13; 	 \</u></ditem>
             <ditem key="list1_Ints">
                 <list>
                     <i v="1"/>
@@ -148,9 +156,47 @@ bc	 </u></ditem>
                     </dict></list></ditem>
         </dict></list>
 
+A string (or dict key) with characters that XML 1.0 doesn't allow at all
+(most C0 control characters such as form-feed and backspace, plus lone
+surrogates, U+FFFE, and U+FFFF) gets the attribute `esc="u"`, and those
+characters, and backslash, are written as `\\uXXXX`. For example, "a\\fb\\c"
+is written as `<u esc="u">a\\u000cb\\u005cc</u>`. '''--iformat xml''' decodes
+them again.
+
 
 =Options=
 
+* '''--benchmark'''
+
+Instead of converting each file, load it and report how big it comes out,
+and how long it takes to write and read back (best of 3), in each of XML
+(unindented), `--oformat binary`, and JSON (Python's C-accelerated `json`, for
+reference). From Python, use `compareFormats(pyObject)`.
+
+* '''--iformat''' `f`
+
+What form the input is in: 'json' (the default), 'binary' (as written by
+`--oformat binary`), or 'xml' to read back XML
+as written by this script (including the '''--tables''' and '''--rle''' forms),
+for example to turn it back into JSON with `--iformat xml --oformat json`.
+From Python, use `loadXml(fh)`, or `iterLoadXml(fh)` to get the items of a
+top-level list one at a time. These use a pull parser and throw away each
+element once used, so no DOM is built, and `iterLoadXml()` takes about
+constant memory no matter how long the list is.
+Some things don't come back exactly: booleans come back as ints (since
+that's how they're written), `class` attributes are ignored, and an `object`
+comes back as a list of its item values (since their names aren't written).
+
+* '''--ndjson''' (or '''--jsonl''')
+
+Treat each input line as a separate JSON record (as in log files), and
+write them all wrapped in a single `list` element (the same XML that a JSON
+array of the records would give). Blank lines are skipped, as are lines that
+fail to parse (with a message). With '''--jobs''' `n`, lines
+are handed out '''--chunkLines''' at a time to a pool of `n`
+processes; the output is still in input order.
+Only applies to `--oformat xml`, and can't be used with '''--benchmark'''.
+
 * '''--noprop'''
 
 Untag the "pyxs:prop" elements from the XML output. Where they have names,
@@ -178,8 +224,32 @@ Choose what form to write out. Choices include:
 ** 'xml': the default, as described above.
 ** 'json': just gets pretty-printing)
 ** 'report': a summary report, as produced by my `alogging.ALogger.formatRec()`.
+** 'binary': a compact length-prefixed binary form of the same data model
+(including the distinctions JSON can't make, such as tuple vs. list, and bool
+vs. int). Each value is a type byte followed by its data; dict keys are
+written out only the first time, and referred to by number after that.
+See the comments before `BINARY_MAGIC` for the details. From Python, use
+`serialize2binary()` or `writeBinary()` to write it, and `loadBinary()` to
+read it back (objects come back as `Str`, since their class isn't recorded).
+For record-like data, this is about a fifth the size of the XML, and reads
+back about twice as fast.
 ** ...more to be added, such as Python and Perl dcls, maybe HTML list layout.
 
+* '''--outdir''' `dir`
+
+Instead of writing everything to stdout, mirror the input files (and
+directories, which are searched as usual for PowerWalk) into `dir`: for
+example `json2xml.py --outdir out data` converts `data/a/foo.json` to
+`out/a/foo.xml` (the extension depends on '''--oformat''': `.xml`, `.json`,
+`.txt` for 'report', or `.j2xb` for 'binary'). With '''--jobs''' `n`, files are
+converted by a pool of `n` processes. Each output is written to a temporary
+file and then renamed into place, so an interrupted run never leaves a
+partial output that looks up to date. At the end, a count of files
+converted, skipped, and failed is shown. Files that haven't changed since
+the last run are skipped (see '''--skipBy'''), so
+repeated runs over a large archive only redo what's new.
+From Python, use `convertTree()` or `convertFile()`.
+
 * '''--pad''' `n`
 
 Left-pad integers with spaces, to a minimum of `n` columns.
@@ -188,6 +258,70 @@ Left-pad integers with spaces, to a minimum of `n` columns.
 * '''--quiet''' OR '''-q'''
 Suppress most messages.
 
+* '''--rle'''
+
+Run-length compress lists and tuples: when the same item occurs 3 or more
+times in a row, write it once, followed by `<repeat n="k"/>`, which means
+"and `k` more of the previous item". For example, `[ 0, 0, 0, 0, 7 ]` becomes:
+
+    <list>
+        <i v="0"/>
+        <repeat n="3"/>
+        <i v="7"/></list>
+
+Items count as the same only if they'd be written the same (so `1`, `1.0`,
+and `true` differ, as do dicts with the same items in different orders).
+In tuples, the `repeat` goes between the `item` elements. Each item is
+only compared to the one before it, so this stays linear.
+From Python, pass `rle=True` to `serialize2xml()` and friends;
+`expandRepeats()` expands the `repeat`s in an `xml.etree.ElementTree` tree.
+
+* '''--skipBy''' `how`
+
+With '''--outdir''', how to decide that an output file is already up to date:
+
+** 'mtime' (the default): it exists and is newer than its input.
+** 'hash': keep a manifest (`.json2xml-manifest.json` in the output
+directory) of each input's size, modification time, and SHA-256 hash,
+and the conversion options. A file is skipped if its output exists, the
+options are the same, and its size and time are unchanged; or its size is
+unchanged and its hash still matches (so a file that was merely touched or
+copied isn't redone).
+** 'none': convert everything.
+
+* '''--stream'''
+
+Convert JSON to XML as it is read, instead of loading the whole thing first.
+This starts writing at once, and takes about constant memory no matter how big
+the input is. The input may also be several JSON values in a row, such as a
+JSON Lines file; each is converted in turn. Only applies to `--oformat xml`.
+This can't see ahead, so ignores '''--tables''' and '''--rle'''.
+
+* '''--tables'''
+
+Write each list of "records" as a `table` element, with one empty `row`
+element per record, whose attributes are the record's items. This is
+much smaller (and faster) than the usual form, for the common case of an
+array of like objects. A list qualifies if it has at least 2 items, all
+plain dicts with the same keys in the same order, the keys are identifiers
+(and don't start with "xml"), and each key's values are all scalars
+of one type (or null). For example:
+
+    [ { "id": 1, "name": "aardvark", "wt": 2.5 },
+      { "id": 2, "name": "boar",     "wt": null } ]
+
+becomes:
+
+    <table keys="id name wt" types="i u f">
+        <row id="1" name="aardvark" wt="2.500000"/>
+        <row id="2" name="boar"/></table>
+
+The `keys` attribute gives the columns in order, and `types` gives the type
+of each (as the element name it would have otherwise: `i`, `f`, `u`, or
+`None` if it's always null). A null item is just left out of its row.
+From Python, pass `tables=True` to `serialize2xml()` and friends;
+`tableShape()` does the checking.
+
 * '''--verbose'''
 
 Add more detailed messages (doesn't do much at the moment).
@@ -244,8 +378,7 @@ some cost in verbosity, effective portability, and/or clarity.
 * Test with non-string dict keys.
 * Add support for changing the XML tags to use.
 * Add more --oformat choices, such as Python and Perl dcls.
-* Finish support for homogeneous collections.
-* Add a loader for round-tripping straight into Python structures.
+* Finish support for homogeneous collections (beyond --tables).
 
 
 =Rights=
@@ -267,6 +400,18 @@ For the most recent version, see [http://www.derose.net/steve/utilities] or
 distinct from "dicts", even though JSON doesn't know. Write out subclasses
 (even though they won't show up for data that was really JSON).
 * 2020-12-09: Clean up. Add --oformat, integrate PowerWalk and alogging.
+* 2026-10-15: Write XML incrementally (`writeXml()`, `iterXml()`).
+Add --stream, `JsonEventReader`, `iterXmlFromEvents()`.
+Add --ndjson, --jobs, --chunkLines. Serialize iteratively, dispatching on
+type via `xmlHandlers`. Add --tables and `tableShape()`; fix length
+checks in `listsMatch()` and `tuplesMatch()`, and the '"' entity.
+Add --rle and `expandRepeats()`. Add --iformat xml, `loadXml()`, and
+`iterLoadXml()`. Write floats exactly when "%f" would lose precision.
+Add --oformat binary, --iformat binary, and --benchmark. Escape with
+tables of replacements instead of regexes, and escape dict keys.
+Add --outdir and --skipBy.
+Fix escaping of "]]>" and CR in text. Encode characters that XML can't
+have (esc="u"). Add --test.
 
 
 =To do=
@@ -274,8 +419,6 @@ distinct from "dicts", even though JSON doesn't know. Write out subclasses
 * Fix --pad.
 * Option to move scalar named items to parent attributes, or not to tag scalars.
 * Option to number items in lists, put len on collections
-* Option to optimize sparse lists (say, where item is same as prev, gen:
-    <repeat n="200"/>
 
 
 =Options=
@@ -285,25 +428,67 @@ distinct from "dicts", even though JSON doesn't know. Write out subclasses
 # What to map various troublesome strings to.
 #
 escMap = {
-    '"'       : '&quo;',
+    '"'       : '&quot;',
     "'"       : '&apos;',
     '<'       : '&lt;',
     '>'       : '&gt;',
     '?>'      : '?&gt;',
     '-->'     : '- - >',
-    ']]>'     : '&rsqb;]>',
+    ']]>'     : ']]&gt;',
     '&'       : '&amp;',
+    '\n'      : '&#10;',  # (so attribute values keep their whitespace)
+    '\r'      : '&#13;',
+    '\t'      : '&#9;',
 }
-def _escaper(mat):
-    return escMap[mat.group(1)]
+
+# What needs escaping where, in the order to do it ('&' first, so the
+# other escapes don't get re-escaped). Most strings need nothing done, which
+# the `in` tests find out quickly. Each str.replace() is one C-speed pass,
+# which beats both re.sub() with a callback, and str.translate() (which is
+# slow when mapping characters to longer strings).
+#
+textEscapes = [ (c, escMap[c]) for c in ('&', '<', '\r', ']]>') ]
+attrEscapes = [ (c, escMap[c]) for c in ('&', '"', '<', '\n', '\r', '\t') ]
+
 def escapeAttribute(s):
-    return re.sub(r'(["<&])', _escaper, s)
+    if ('&' not in s and '"' not in s and '<' not in s and
+        '\n' not in s and '\r' not in s and '\t' not in s): return s
+    for c, esc in attrEscapes:
+        if (c in s): s = s.replace(c, esc)
+    return s
 def escapeText(s):
-    return re.sub(r'(<|&|]]>])', _escaper, s)
+    if ('&' not in s and '<' not in s and '\r' not in s and
+        ']]>' not in s): return s
+    for c, esc in textEscapes:
+        if (c in s): s = s.replace(c, esc)
+    return s
 def escapePI(s):
-    return re.sub(r'(\?>)', _escaper, s)
+    return s.replace("?>", escMap["?>"])
 def escapeComment(s):
-    return re.sub(r'(-->)', _escaper, s)
+    return s.replace("-->", escMap["-->"])
+
+# Characters JSON strings may have, but XML 1.0 can't (not even as character
+# references): most C0 controls, surrogates, U+FFFE, and U+FFFF. A string with
+# any is written with esc="u", and all of those, and backslash, as "\uXXXX".
+#
+xmlIllegalChars = r"\x00-\x08\x0B\x0C\x0E-\x1F\uD800-\uDFFF\uFFFE\uFFFF"
+xmlIllegalExpr = re.compile("[%s]" % (xmlIllegalChars))
+xmlEncodeExpr = re.compile(r"[%s\\]" % (xmlIllegalChars))
+xmlDecodeExpr = re.compile(r"\\u([0-9a-fA-F]{4})")
+
+def encodeIllegal(s):
+    return xmlEncodeExpr.sub(lambda mat: "\\u%04x" % (ord(mat.group())), s)
+def decodeIllegal(s):
+    return xmlDecodeExpr.sub(lambda mat: chr(int(mat.group(1), 16)), s)
+
+def ditemStart(k):
+    """Return the start-tag for a dict item with key `k` (keys that aren't
+    strings are written as str() of themselves).
+    """
+    if (k.__class__ is not str): k = str(k)
+    if (xmlIllegalExpr.search(k)):
+        return '<ditem key="%s" esc="u">' % (escapeAttribute(encodeIllegal(k)))
+    return '<ditem key="%s">' % (escapeAttribute(k))
 
 
 ###############################################################################
@@ -314,101 +499,1215 @@ class Str:
     def __init__(self, **entries):
         self.__dict__.update(entries)
 
-def serialize2xml(pyObject, istring='    ', depth=0):
-    """Return an XML serialization of the object (recursive).
+def serialize2xml(pyObject, istring='    ', depth=0, tables=False, rle=False):
+    """Return an XML serialization of the object.
     Typically we expect JSON, but it doesn't have to be.
+    This builds the whole result in memory; for big data use writeXml().
     """
-    # Collection types
-    #
-    buf = ""
-    if (isinstance(pyObject, tuple)):                   # TUPLE
-        if (istring): buf += "\n" + (istring * depth)
-        if (type(pyObject).__name__ != 'tuple'):
-            buf += '<tuple class="%s">' % (type(pyObject).__name__)
+    return "".join(iterXml(pyObject, istring=istring, depth=depth,
+        tables=tables, rle=rle))
+
+def writeXml(pyObject, ofh, istring='    ', depth=0, bufSize=1<<16,
+    tables=False, rle=False):
+    """Write an XML serialization of the object to the file handle `ofh`,
+    as it is generated, in writes of about `bufSize` characters.
+    Memory use depends on the nesting depth, not the size of the data.
+    """
+    writeChunks(iterXml(pyObject, istring=istring, depth=depth,
+        tables=tables, rle=rle), ofh, bufSize=bufSize)
+
+def writeChunks(chunks, ofh, bufSize=1<<16):
+    """Write a series of strings (or bytes) to `ofh`, in writes of
+    about `bufSize`.
+    """
+    buf = []
+    bufLen = 0
+    for chunk in chunks:
+        buf.append(chunk)
+        bufLen += len(chunk)
+        if (bufLen >= bufSize):
+            ofh.write(chunk[:0].join(buf))
+            buf = []
+            bufLen = 0
+    if (buf): ofh.write(buf[0][:0].join(buf))
+
+def iterXml(pyObject, istring='    ', depth=0, tables=False, rle=False):
+    """Generate an XML serialization of the object, as a series of strings.
+    This uses an explicit stack rather than recursion, so there is no limit on
+    nesting depth; and looks up how to handle each node by its type, in
+    `xmlHandlers` (see registerXmlHandler()).
+    If `tables` is set, lists of same-shaped records are written as
+    <table> (see tableShape()). If `rle` is set, runs of the same item in
+    lists and tuples are shortened with <repeat> (see itemRuns()).
+    """
+    resolved = _resolvedHandlers
+    if (tables or rle):
+        resolved = dict(_resolvedHandlers)
+        resolved[list] = rleList2xml if (rle) else xmlHandlerFor(list)
+        if (rle): resolved[tuple] = rleTuple2xml
+        if (tables): resolved[list] = tableOr(resolved[list])
+    return walkNodes(pyObject, resolved, xmlHandlerFor, IndentCache(istring),
+        depth=depth, empty="")
+
+def walkNodes(pyObject, resolved, handlerFor, context, depth=0, empty=""):
+    """The traversal behind iterXml() and iterBinary(). Generate the output
+    for `pyObject` as a series of strings (or bytes, if `empty` is b"").
+    Each node's handler comes from the dict `resolved` by its type, or else
+    from handlerFor(type), and is called as handler(node, depth, context).
+    """
+    # Each stack entry has an iterator over the remaining children of a
+    # container, and what to write after them all.
+    stack = [ (iter([ (empty, pyObject, depth, empty) ]), empty) ]
+    children = stack[-1][0]
+    while (True):
+        nxt = next(children, None)
+        if (nxt is None):
+            closer = stack.pop()[1]
+            if (closer): yield closer
+            if (not stack): return
+            children = stack[-1][0]
+            continue
+        before, node, d, after = nxt
+        handler = resolved.get(node.__class__) or handlerFor(node.__class__)
+        result = handler(node, d, context)
+        if (result.__class__ is not tuple):
+            yield before + result + after
         else:
-            buf += "<tuple>"
-        depth += 1
-        for k, v in pyObject.items():
-            if (istring): buf += "\n" + (istring * depth)
-            buf += "<item>%s</item>" % (
-                serialize2xml(v, istring=istring,depth=depth))
-        depth -= 1
-        buf += "</tuple>"
-        return buf
-
-    elif (isinstance(pyObject, dict)):                   # DICT
-        if (istring): buf += "\n" + (istring * depth)
-        if (type(pyObject).__name__ != 'dict'):
-            buf += '<dict class="%s">' % (type(pyObject).__name__)
+            opener, grandchildren, closer = result
+            yield before + opener
+            children = iter(grandchildren)
+            stack.append((children, closer + after))
+
+class IndentCache(dict):
+    """Map each depth to the newline-plus-indentation to write at it
+    (or to "" if there is no indent string), computing each just once.
+    Very deep levels aren't kept, since the strings get long.
+    """
+    maxCached = 256
+
+    def __init__(self, istring):
+        super(IndentCache, self).__init__()
+        self.istring = istring
+
+    def __missing__(self, depth):
+        ind = ("\n" + self.istring * depth) if (self.istring) else ""
+        if (depth < self.maxCached): self[depth] = ind
+        return ind
+
+
+###############################################################################
+# How to write each type. A handler is called with the node, its depth, and
+# an IndentCache; and returns either a string (the whole XML for the node), or
+# an (opener, children, closer) triple for a container. `children` is an
+# iterable of (before, child, childDepth, after) tuples, where `before` and
+# `after` are written around the child's own XML.
+#
+def classAttr(node, baseName):
+    name = type(node).__name__
+    return (' class="%s"' % (name)) if (name != baseName) else ""
+
+def tuple2xml(node, d, indents):
+    itemStart = indents[d+1] + "<item>"
+    return (indents[d] + "<tuple%s>" % (classAttr(node, 'tuple')),
+        ((itemStart, v, d+1, "</item>") for v in node),
+        "</tuple>")
+
+def dict2xml(node, d, indents):
+    ind1 = indents[d+1]
+    return (indents[d] + "<dict%s>" % (classAttr(node, 'dict')),
+        ((ind1 + ditemStart(k), v, d+2, "</ditem>")
+            for k, v in node.items()),
+        indents[d] + "</dict>")
+
+def list2xml(node, d, indents):
+    ind1 = indents[d+1]
+    return (indents[d] + "<list%s>" % (classAttr(node, 'list')),
+        ((ind1, v, d+1, "") for v in node),
+        "</list>")
+
+def tableOr(listHandler):
+    """Make a list handler that writes tables where it can (see tableShape()),
+    and uses `listHandler` for other lists.
+    """
+    def listOrTable2xml(node, d, indents):
+        shape = tableShape(node)
+        if (shape is None): return listHandler(node, d, indents)
+        return table2xml(node, d, indents, shape)
+    return listOrTable2xml
+
+def table2xml(node, d, indents, shape):
+    """Write a list of records as one <table> with a <row> per record, whose
+    attributes are the record's items. The `keys` and `types` attributes on
+    the table give the columns (in order) and their types (as the scalar
+    element names: i, f, u, or None if the column is always null).
+    Null items are just left out of their row.
+    """
+    keys, types = shape
+    fmts = [ scalarFormats[t] for t in types ]
+    rowStart = indents[d+1] + "<row"
+    # Most rows have no nulls, and can be done with a single format.
+    fullFormat = rowStart + "".join(
+        ' %s="%s"' % (k, fmt[0]) for k, fmt in zip(keys, fmts)) + "/>"
+    convCols = [ (i, attrConverters[t]) for i, t in enumerate(types)
+        if (t in attrConverters) ]
+    cols = list(zip(keys, fmts))
+
+    def rowChunks(rowsPerChunk=256):
+        buf = []
+        for rec in node:
+            vals = [ rec[k] for k in keys ]
+            for i, conv in convCols:
+                if (vals[i] is not None): vals[i] = conv(vals[i])
+            if (None in vals):
+                buf.append(rowStart + "".join(
+                    ' %s="%s"' % (k, fmt[0] % (v))
+                    for (k, fmt), v in zip(cols, vals) if (v is not None))
+                    + "/>")
+            else:
+                buf.append(fullFormat % tuple(vals))
+            if (len(buf) >= rowsPerChunk):
+                yield ("", RawXml("".join(buf)), d+1, "")
+                buf = []
+        if (buf): yield ("", RawXml("".join(buf)), d+1, "")
+
+    return (indents[d] + '<table keys="%s" types="%s">' % (
+        " ".join(keys), " ".join(types)), rowChunks(), "</table>")
+
+def rleTuple2xml(node, d, indents):
+    itemStart = indents[d+1] + "<item>"
+    return (indents[d] + "<tuple%s>" % (classAttr(node, 'tuple')),
+        rleChildren(node, d, indents, itemStart, "</item>"),
+        "</tuple>")
+
+def rleList2xml(node, d, indents):
+    return (indents[d] + "<list%s>" % (classAttr(node, 'list')),
+        rleChildren(node, d, indents, indents[d+1], ""),
+        "</list>")
+
+def rleChildren(node, d, indents, before, after, minRun=3):
+    """Generate the children for a list or tuple, writing a run of `minRun` or
+    more of the same item as the item once, then <repeat n="k"/> meaning
+    "and k more of the previous item".
+    """
+    repeatStart = indents[d+1] + '<repeat n="'
+    for v, n in itemRuns(node):
+        yield (before, v, d+1, after)
+        if (n >= minRun):
+            yield ("", RawXml('%s%d"/>' % (repeatStart, n-1)), d+1, "")
         else:
-            buf += "<dict>"
-        depth += 1
-        for k, v in pyObject.items():
-            if (istring): buf += "\n" + (istring * depth)
-            buf += "<ditem key=\"%s\">%s</ditem>" % (
-                k, serialize2xml(v, istring=istring,depth=depth+1))
-        depth -= 1
-        if (istring): buf += "\n" + (istring * depth)
-        buf += "</dict>"
-        return buf
-
-    elif (isinstance(pyObject, list)):                   # LIST
-        if (istring): buf += "\n" + (istring * depth)
-        if (type(pyObject).__name__ != 'list'):
-            buf += '<list class="%s">' % (type(pyObject).__name__)
+            for _i in range(n-1): yield (before, v, d+1, after)
+
+class RawXml(str):
+    """A string that is already XML, to be written as is.
+    """
+
+def raw2xml(node, d, indents):
+    return str(node)
+
+def object2xml(node, d, indents):
+    itemStart = indents[d+1] + "<item>"
+    return (indents[d] + "<object%s>" % (classAttr(node, 'object')),
+        ((itemStart, v, d+1, "</item>") for k, v in node.__dict__.items()
+            if (not callable(v) and not k.startswith('__'))),
+        "</object>")
+
+def int2xml(node, d, indents):
+    return '<i v="%d"/>' % (node)
+
+def floatStr(f):
+    """Format a float with "%f", unless that would lose precision.
+    """
+    s = "%f" % (f)
+    if (float(s) != f): s = repr(f)
+    return s
+
+def float2xml(node, d, indents):
+    return '<f v="%s"/>' % (floatStr(node))
+
+def complex2xml(node, d, indents):
+    return '<c r="%s" i="%s"/>' % (floatStr(node.real), floatStr(node.imag))
+
+def str2xml(node, d, indents):
+    if (xmlIllegalExpr.search(node)):
+        return '<u esc="u">%s</u>' % (escapeText(encodeIllegal(node)))
+    return '<u>%s</u>' % (escapeText(node))
+
+def none2xml(node, d, indents):
+    return '<None/>'
+
+# Keyed by type; subclasses find their nearest registered ancestor (thus bool
+# goes to int, OrderedDict to dict, and anything else to object).
+#
+xmlHandlers = {
+    tuple:      tuple2xml,
+    dict:       dict2xml,
+    list:       list2xml,
+    int:        int2xml,
+    float:      float2xml,
+    complex:    complex2xml,
+    str:        str2xml,
+    type(None): none2xml,
+    object:     object2xml,
+    RawXml:     raw2xml,
+}
+_resolvedHandlers = {}
+
+def registerXmlHandler(theType, handler):
+    """Make iterXml() (and so serialize2xml() and writeXml()) write nodes of
+    type `theType` (and its subclasses) using `handler`, as described above.
+    """
+    xmlHandlers[theType] = handler
+    _resolvedHandlers.clear()
+
+def xmlHandlerFor(theType):
+    return handlerFor(theType, xmlHandlers, _resolvedHandlers)
+
+def handlerFor(theType, handlers, resolved):
+    """Find the handler for `theType` in `handlers`, or for its nearest
+    ancestor that has one, remembering the answer in `resolved`.
+    """
+    try:
+        return resolved[theType]
+    except KeyError:
+        for t in theType.__mro__:
+            if (t in handlers): break
+        handler = resolved[theType] = handlers[t]
+        return handler
+
+
+###############################################################################
+# Run-length compression. Consecutive items of a list or tuple that would be
+# written the same are written once, followed by <repeat n="k"/> (see
+# rleChildren()). expandRepeats() undoes that in a parsed XML tree.
+#
+rleScalarTypes = set([ int, bool, float, complex, str, type(None) ])
+
+def itemRuns(items):
+    """Generate (item, runLength) for each run of the same item in `items`.
+    Each item is compared only to the one before it, so this is linear.
+    """
+    it = iter(items)
+    for prev in it: break
+    else: return
+    n = 1
+    for v in it:
+        if (v is prev or sameNode(v, prev)):
+            n += 1
         else:
-            buf += "<list>"
-        depth += 1
-        for v in pyObject:
-            if (istring): buf += "\n" + (istring * depth)
-            #buf += "<item>%s</item>" % (serialize2xml(v, istring=istring, depth=depth))
-            buf += serialize2xml(v, istring=istring, depth=depth)
-        depth -= 1
-        buf += "</list>"
-        return buf
-
-    # Scalar types (order of testing matters)
-    #
-    elif (isinstance(pyObject, int)):
-        return '<i v="%d"/>' % (pyObject)
+            yield prev, n
+            prev = v
+            n = 1
+    yield prev, n
+
+def sameNode(a, b):
+    """Would `a` and `b` be serialized the same? Like ==, but the types
+    must match exactly (1, 1.0, and True are all ==), and so must dict key
+    order. Containers are first compared with the (C-speed) ==; only if that
+    succeeds are they walked (without recursion) to check types and order.
+    """
+    cls = a.__class__
+    if (cls is not b.__class__): return False
+    if (cls in rleScalarTypes):
+        return (a == b and (cls not in signedZeroTypes or sameSigns(a, b)))
+    try:
+        if (not (a == b)): return False
+    except RecursionError:
+        return False
+    stack = [ (a, b) ]
+    while (stack):
+        x, y = stack.pop()
+        if (x.__class__ is not y.__class__): return False
+        if (isinstance(x, dict)):
+            if (list(x.keys()) != list(y.keys())): return False
+            stack.extend(zip(x.values(), y.values()))
+        elif (isinstance(x, (list, tuple))):
+            stack.extend(zip(x, y))
+        elif (x.__class__ in signedZeroTypes and not sameSigns(x, y)):
+            return False
+    return True
 
-    elif (isinstance(pyObject, float)):
-        return '<f v="%f"/>' % (pyObject)
+signedZeroTypes = set([ float, complex ])
 
-    elif (isinstance(pyObject, complex)):
-        return '<c r="%f" i="%f"/>' % (pyObject.real, pyObject.imag)
+def sameSigns(x, y):
+    """For floats (or complexes) that are ==, do the signs match too? They
+    might not, since 0.0 == -0.0, but they're written differently.
+    """
+    if (x.__class__ is complex):
+        return (sameSigns(x.real, y.real) and sameSigns(x.imag, y.imag))
+    return math.copysign(1.0, x) == math.copysign(1.0, y)
+
+def expandRepeats(root):
+    """Replace each <repeat n="k"/> under the (xml.etree.ElementTree) Element
+    `root`, by k copies of the element before it, returning `root`.
+    """
+    import copy
+    for parent in reversed(list(root.iter())):  # Innermost first
+        if (parent.find("repeat") is None): continue
+        kids = list(parent)
+        for kid in kids: parent.remove(kid)
+        for kid in kids:
+            if (kid.tag != "repeat"):
+                parent.append(kid)
+                continue
+            if (len(parent) == 0):
+                raise ValueError("<repeat> with no preceding item.")
+            prev = parent[-1]
+            for _i in range(int(kid.get("n"))):
+                parent.append(copy.deepcopy(prev))
+            parent[-1].tail = kid.tail
+    return root
 
-    elif (isinstance(pyObject, str)):
-        return '<u>%s</u>' % (escapeText(pyObject))
 
-    elif (pyObject is True):
-        return '<T/>'
+###############################################################################
+# Loading XML in the form written above, back into Python. The expat parser
+# calls an XmlLoadTarget for each start and end tag (instead of building
+# Elements), which keeps a stack of the containers being filled in. So no DOM
+# is built, and iterLoadXml() can hand back the items of a huge top-level list
+# one at a time.
+#
+def _repeatLast(vals, n):
+    """Return `n` more copies of the last of `vals` (for <repeat n="n"/>).
+    """
+    if (not vals): raise ValueError("<repeat> with no preceding item.")
+    import copy
+    prev = vals[-1]
+    if (isinstance(prev, (list, tuple, dict))):
+        return [ copy.deepcopy(prev) for _i in range(n) ]
+    return [ prev ] * n
+
+class XmlLoadTarget:
+    """A target for xml.etree.ElementTree.XMLParser, which rebuilds the Python
+    data from XML as written by serialize2xml() (including the --tables and
+    --rle forms). Finished values are added to `self.done`: if `itemsOf` is
+    set and the top-level element is a list, tuple, or table, each of its items
+    as soon as it ends; otherwise, just the one whole value.
+    """
+    containers = set([ "list", "tuple", "dict", "object", "table",
+        "item", "ditem" ])
+
+    def __init__(self, itemsOf=True):
+        self.frames = []    # [tag, values so far, attrs] per open element
+        self.text = []      # Text so far in a <u>
+        self.done = []
+        self.itemsOf = itemsOf
+        self.streaming = False
+
+    def start(self, tag, attrs):
+        if (not self.frames and self.itemsOf and
+            tag in ("list", "tuple", "table", "object")):
+            self.streaming = True
+        if (tag == "table"):
+            attrs = list(zip(attrs["keys"].split(),
+                [ scalarFormats[t][1] for t in attrs["types"].split() ]))
+        self.frames.append([ tag, [], attrs ])
+        if (tag == "u"): self.text = []
+
+    def data(self, text):
+        if (self.frames and self.frames[-1][0] == "u"): self.text.append(text)
+
+    def end(self, tag):
+        frames = self.frames
+        tag, vals, attrs = frames.pop()
+        if (tag == "i"): value = int(attrs["v"])
+        elif (tag == "u"):
+            value = "".join(self.text)
+            if ("esc" in attrs): value = decodeIllegal(value)
+        elif (tag == "f"): value = float(attrs["v"])
+        elif (tag == "None"): value = None
+        elif (tag == "ditem"):
+            key = attrs["key"]
+            if ("esc" in attrs): key = decodeIllegal(key)
+            value = (key, vals[0])
+        elif (tag == "item"): value = vals[0]
+        elif (tag == "dict"): value = dict(vals)
+        elif (tag == "list" or tag == "object" or tag == "table"): value = vals
+        elif (tag == "tuple"): value = tuple(vals)
+        elif (tag == "row"):
+            value = {}
+            for k, convert in frames[-1][2]:
+                v = attrs.get(k)
+                value[k] = None if (v is None or convert is None) else convert(v)
+        elif (tag == "c"):
+            value = complex(float(attrs["r"]), float(attrs["i"]))
+        elif (tag == "repeat"):
+            copies = _repeatLast(frames[-1][1], int(attrs["n"]))
+            if (self.streaming and len(frames) == 1): self.done.extend(copies)
+            else: frames[-1][1].extend(copies)
+            return
+        else:
+            raise ValueError("Unknown element <%s>." % (tag))
+
+        if (not frames):
+            if (not self.streaming): self.done.append(value)
+        elif (self.streaming and len(frames) == 1):
+            # An item of the top level: hand it over, but keep the last one
+            # in case a <repeat> follows.
+            frames[0][1][:] = [ value ]
+            self.done.append(value)
+        else:
+            frames[-1][1].append(value)
+
+    def close(self):
+        return self.done
+
+def iterLoadXml(fh, itemsOf=True, chunkSize=1<<16):
+    """Read XML as written by serialize2xml() from `fh` (which may give str or
+    bytes), and generate the Python data: the items of the top-level list
+    one by one if `itemsOf` is set (see XmlLoadTarget), else the whole value.
+    The loaded types are those of JSON, so some things don't come back
+    exactly: bools are ints, a `class` attribute is ignored, and an <object>
+    becomes a list of its (nameless) item values.
+    Parse errors raise xml.etree.ElementTree.ParseError.
+    """
+    import xml.etree.ElementTree as ET
+    target = XmlLoadTarget(itemsOf=itemsOf)
+    parser = ET.XMLParser(target=target)
+    while (True):
+        chunk = fh.read(chunkSize)
+        if (chunk): parser.feed(chunk)
+        else: parser.close()
+        if (target.done):
+            done, target.done = target.done, []
+            for value in done: yield value
+        if (not chunk): return
+
+def loadXml(fh):
+    """Read XML as written by serialize2xml() from `fh`, and return the data.
+    The cyclic garbage collector is paused meanwhile, since the loaded
+    data can't have cycles, and it otherwise spends most of the time
+    re-scanning it as it grows.
+    """
+    import gc
+    wasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        for value in iterLoadXml(fh, itemsOf=False): return value
+    finally:
+        if (wasEnabled): gc.enable()
+    raise ValueError("No XML data found.")
 
-    elif (pyObject is False):
-        return '<F/>'
 
-    elif (pyObject is None):
-        return '<None/>'
+###############################################################################
+# Binary form. The same data model as the XML, but length-prefixed, so it's
+# smaller and much faster to read back. It is written by the same traversal
+# as the XML (walkNodes()), using `binaryHandlers`. The format is
+# BINARY_MAGIC and then one value, each value being a type byte and then:
+#
+#     N, T, F    None, True, False (nothing more)
+#     i          a zigzag varint (so any size int works)
+#     f          a little-endian double
+#     c          two doubles (real, imaginary)
+#     s          a varint byte length, then that much UTF-8
+#     l, t       (list, tuple) a varint count, then that many values
+#     d, o       (dict, object) a varint count, then that many key/value pairs
+#
+# Varints are unsigned LEB128 (7 bits per byte, low first, high bit set on
+# all but the last byte). A key is "k" and a string like "s" the first time,
+# and after that "K" and a varint giving which key it was (counting from 0);
+# any other key is "v" then the key as a value.
+#
+BINARY_MAGIC = b"J2XB1\n"
+_packDouble = struct.Struct("<d").pack
+_packComplex = struct.Struct("<dd").pack
+_unpackDouble = struct.Struct("<d").unpack_from
+_unpackComplex = struct.Struct("<dd").unpack_from
+_smallVarints = [ bytes((n,)) for n in range(128) ]
+
+def varint(n):
+    if (n < 0x80): return _smallVarints[n]
+    buf = bytearray()
+    while (n >= 0x80):
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+    return bytes(buf)
+
+def readVarint(data, pos):
+    """Return the varint at `pos` in `data`, and the position after it.
+    """
+    b = data[pos]
+    if (b < 0x80): return b, pos+1
+    n = b & 0x7F
+    shift = 7
+    while (True):
+        pos += 1
+        b = data[pos]
+        n |= (b & 0x7F) << shift
+        if (b < 0x80): return n, pos+1
+        shift += 7
+
+def str2bin(node, d, keyIds):
+    b = node.encode("utf-8", "surrogatepass")
+    return b"s" + varint(len(b)) + b
+
+def int2bin(node, d, keyIds):
+    return b"i" + varint((node << 1) if (node >= 0) else ((-node << 1) - 1))
+
+def bool2bin(node, d, keyIds):
+    return b"T" if (node) else b"F"
+
+def float2bin(node, d, keyIds):
+    return b"f" + _packDouble(node)
+
+def complex2bin(node, d, keyIds):
+    return b"c" + _packComplex(node.real, node.imag)
+
+def none2bin(node, d, keyIds):
+    return b"N"
+
+def list2bin(node, d, keyIds):
+    return (b"l" + varint(len(node)), binChildren(node, d, keyIds), b"")
+
+def tuple2bin(node, d, keyIds):
+    return (b"t" + varint(len(node)), binChildren(node, d, keyIds), b"")
+
+def dict2bin(node, d, keyIds):
+    return (b"d" + varint(len(node)),
+        binChildren(node.items(), d, keyIds, isMap=True), b"")
+
+def object2bin(node, d, keyIds):
+    items = [ (k, v) for k, v in node.__dict__.items()
+        if (not callable(v) and not k.startswith('__')) ]
+    return (b"o" + varint(len(items)),
+        binChildren(items, d, keyIds, isMap=True), b"")
+
+class _NoValue:
+    """Stands for nothing, so binChildren() has a child to hang the last
+    run of scalars on.
+    """
 
-    elif (isinstance(pyObject, object)):
-        if (istring): buf += "\n" + (istring * depth)
-        if (type(pyObject).__name__ != 'object'):
-            buf += '<object class="%s">' % (type(pyObject).__name__)
+def binChildren(items, d, keyIds, isMap=False):
+    """Generate the children of a container for walkNodes(). The scalars are
+    written right here, and passed on in runs as the `before` of the next
+    container, which saves a trip through walkNodes() for each.
+    `items` are (key, value) pairs if `isMap`, else just values.
+    """
+    resolved = _resolvedBinaryHandlers
+    buf = []
+    for v in items:
+        if (isMap):
+            buf.append(key2bin(v[0], keyIds))
+            v = v[1]
+        cls = v.__class__
+        if (cls in binaryScalarTypes):
+            handler = resolved.get(cls) or binaryHandlerFor(cls)
+            buf.append(handler(v, d+1, keyIds))
         else:
-            buf += "<object>"
-        depth += 1
-        for k, v in pyObject.__dict__:
-            if (callable(v)): continue
-            if (k.startswith('__')): continue
-            if (istring): buf += "\n" + (istring * depth)
-            buf += "<item>%s</item>" % (
-                serialize2xml(v, istring=istring,depth=depth))
-        depth -= 1
-        buf += "</object>"
-        return buf
+            yield (b"".join(buf), v, d+1, b"")
+            buf = []
+    if (buf): yield (b"".join(buf), _NoValue(), d+1, b"")
+
+def key2bin(k, keyIds):
+    """Write a dict key, as a reference to the same key earlier if we can.
+    `keyIds` maps each string key so far to its number.
+    """
+    if (k.__class__ is str):
+        try:
+            return b"K" + varint(keyIds[k])
+        except KeyError:
+            keyIds[k] = len(keyIds)
+            b = k.encode("utf-8", "surrogatepass")
+            return b"k" + varint(len(b)) + b
+    return b"v" + b"".join(iterBinary(k))
+
+binaryHandlers = {
+    tuple:      tuple2bin,
+    dict:       dict2bin,
+    list:       list2bin,
+    bool:       bool2bin,
+    int:        int2bin,
+    float:      float2bin,
+    complex:    complex2bin,
+    str:        str2bin,
+    type(None): none2bin,
+    object:     object2bin,
+    _NoValue:   lambda node, d, keyIds: b"",
+}
+_resolvedBinaryHandlers = {}
+binaryScalarTypes = set([ bool, int, float, complex, str, type(None) ])
+
+def binaryHandlerFor(theType):
+    return handlerFor(theType, binaryHandlers, _resolvedBinaryHandlers)
 
+def iterBinary(pyObject):
+    """Generate the binary form of the object (without BINARY_MAGIC), as
+    a series of bytes.
+    """
+    return walkNodes(pyObject, _resolvedBinaryHandlers, binaryHandlerFor, {},
+        empty=b"")
+
+def serialize2binary(pyObject):
+    """Return the binary form of the object, including BINARY_MAGIC.
+    """
+    return BINARY_MAGIC + b"".join(iterBinary(pyObject))
+
+def writeBinary(pyObject, ofh, bufSize=1<<16):
+    """Write the binary form of the object to the binary file handle `ofh`.
+    """
+    ofh.write(BINARY_MAGIC)
+    writeChunks(iterBinary(pyObject), ofh, bufSize=bufSize)
+
+def loadBinary(fh):
+    """Read the binary form from the binary file handle `fh`, and return the
+    data. Objects come back as `Str` instances.
+    """
+    data = fh.read()
+    if (not data.startswith(BINARY_MAGIC)):
+        raise ValueError("Not json2xml binary data (bad magic number).")
+    value, pos = decodeBinary(data, len(BINARY_MAGIC))
+    if (pos != len(data)):
+        raise ValueError("Extra data after value, at byte %d." % (pos))
+    return value
+
+def decodeBinary(data, pos=0):
+    """Decode the value at `pos` in `data` (without the BINARY_MAGIC), and
+    return it and the position after it. This uses an explicit stack, so
+    there's no limit on nesting depth.
+    """
+    keys = []
+    # One frame per open container: [type byte, items left, values, key]
+    stack = []
+    key = None
+    try:
+        while (True):
+            if (stack and stack[-1][0] in b"do"):
+                t = data[pos]
+                if (t == 75):                                   # K
+                    n, pos = readVarint(data, pos+1)
+                    key = keys[n]
+                elif (t == 107):                                # k
+                    n, pos = readVarint(data, pos+1)
+                    key = data[pos:pos+n].decode("utf-8", "surrogatepass")
+                    keys.append(key)
+                    pos += n
+                elif (t == 118):                                # v
+                    key, pos = decodeBinary(data, pos+1)
+                else:
+                    raise ValueError("Bad key type %r at byte %d." % (
+                        chr(t), pos))
+
+            t = data[pos]
+            pos += 1
+            if (t == 115):                                      # s
+                n, pos = readVarint(data, pos)
+                value = data[pos:pos+n].decode("utf-8", "surrogatepass")
+                pos += n
+            elif (t == 105):                                    # i
+                n, pos = readVarint(data, pos)
+                value = (n >> 1) if (not n & 1) else -((n + 1) >> 1)
+            elif (t == 102):                                    # f
+                value = _unpackDouble(data, pos)[0]
+                pos += 8
+            elif (t == 78): value = None                        # N
+            elif (t == 84): value = True                        # T
+            elif (t == 70): value = False                       # F
+            elif (t == 99):                                     # c
+                value = complex(*_unpackComplex(data, pos))
+                pos += 16
+            elif (t in b"ltdo"):
+                n, pos = readVarint(data, pos)
+                if (n):
+                    stack.append([ t, n, [], key ])
+                    continue
+                value = _makeContainer(t, [])
+            else:
+                raise ValueError("Bad type %r at byte %d." % (chr(t), pos-1))
+
+            # Add the value to its container, and close any that are full.
+            while (True):
+                if (not stack): return value, pos
+                frame = stack[-1]
+                frame[2].append((key, value) if (frame[0] in b"do") else value)
+                frame[1] -= 1
+                if (frame[1]): break
+                stack.pop()
+                value = _makeContainer(frame[0], frame[2])
+                key = frame[3]
+    except (IndexError, struct.error):
+        raise ValueError("Binary data ends too soon.")
+
+def _makeContainer(t, values):
+    if (t == 108): return values                        # l
+    if (t == 100): return dict(values)                  # d
+    if (t == 116): return tuple(values)                 # t
+    return Str(**dict(values))                          # o
+
+
+###############################################################################
+# Compare the output forms for size and speed.
+#
+def compareFormats(pyObject, reps=3):
+    """Write and read back `pyObject` in each form ("xml", "binary", and
+    "json" for reference), `reps` times. Return a list of
+    (form, bytes, bestWriteSeconds, bestReadSeconds).
+    """
+    import io
+    import time
+    forms = [
+        ("xml",
+            lambda o: serialize2xml(o, istring="").encode("utf-8"),
+            lambda b: loadXml(io.BytesIO(b))),
+        ("binary", serialize2binary,
+            lambda b: loadBinary(io.BytesIO(b))),
+        ("json",
+            lambda o: json.dumps(o).encode("utf-8"), json.loads),
+    ]
+    results = []
+    for name, write, read in forms:
+        bestWrite = bestRead = None
+        for _i in range(reps):
+            t0 = time.perf_counter()
+            data = write(pyObject)
+            t1 = time.perf_counter()
+            read(data)
+            t2 = time.perf_counter()
+            if (bestWrite is None or t1 - t0 < bestWrite): bestWrite = t1 - t0
+            if (bestRead is None or t2 - t1 < bestRead): bestRead = t2 - t1
+        results.append((name, len(data), bestWrite, bestRead))
+    return results
+
+
+###############################################################################
+# Incremental ("pull") JSON reading. Instead of building the whole object
+# tree, generate parse events as the input is read, and write XML from them.
+#
+wsExpr = re.compile(r'[ \t\n\r]*')
+numberExpr = re.compile(r'(-?(?:0|[1-9]\d*))(\.\d+)?([eE][-+]?\d+)?')
+jsonConstants = [
+    ('true', True), ('false', False), ('null', None),
+    ('NaN', float('nan')), ('Infinity', float('inf')),
+    ('-Infinity', float('-inf')),
+]
+
+class JsonEventReader:
+    """Read JSON from a file handle a chunk at a time, generating events:
+        ('start_map', None), ('map_key', key), ('end_map', None),
+        ('start_array', None), ('end_array', None), ('scalar', value).
+    Any number of top-level values may follow one another (as in JSON Lines).
+    Memory use is bounded by the nesting depth and the longest single string.
+    Errors raise json.decoder.JSONDecodeError, like json.load().
+    """
+    def __init__(self, fh, chunkSize=1<<16):
+        self.fh = fh
+        self.chunkSize = chunkSize
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Read another chunk (discarding what's been used up).
+        Return False if there's no more.
+        """
+        if (self.eof): return False
+        chunk = self.fh.read(self.chunkSize)
+        if (not chunk):
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def fail(self, msg):
+        raise json.decoder.JSONDecodeError(msg, self.buf, self.pos)
+
+    def skipSpace(self):
+        """Move past any whitespace, and return the next character ("" at EOF).
+        """
+        while (True):
+            self.pos = wsExpr.match(self.buf, self.pos).end()
+            if (self.pos < len(self.buf)): return self.buf[self.pos]
+            if (not self.fill()): return ""
+
+    def readString(self):
+        """Read a string, starting at its opening quote.
+        """
+        rel = 1  # Where to look for the close quote, relative to self.pos
+        while (True):
+            q = self.buf.find('"', self.pos + rel)
+            if (q >= 0):
+                nBack = 0
+                while (self.buf[q-nBack-1] == '\\'): nBack += 1
+                if (nBack % 2 == 0):
+                    s, self.pos = json.decoder.scanstring(self.buf, self.pos+1)
+                    return s
+                rel = q - self.pos + 1
+                continue
+            rel = len(self.buf) - self.pos
+            if (not self.fill()): self.fail("Unterminated string")
+
+    def readAtom(self):
+        """Read a number or a constant such as true or null.
+        """
+        while (True):  # Make sure the whole token is in the buffer
+            mat = numberExpr.match(self.buf, self.pos)
+            if (mat): complete = (mat.end() + 3 <= len(self.buf))
+            else: complete = (len(self.buf) - self.pos >= len("-Infinity"))
+            if (complete or not self.fill()): break
+        if (mat):
+            self.pos = mat.end()
+            if (mat.group(2) or mat.group(3)): return float(mat.group())
+            return int(mat.group())
+        for name, value in jsonConstants:
+            if (self.buf.startswith(name, self.pos)):
+                self.pos += len(name)
+                return value
+        self.fail("Expecting value")
+
+    def readKey(self):
+        if (self.skipSpace() != '"'): self.fail("Expecting property name")
+        key = self.readString()
+        if (self.skipSpace() != ':'): self.fail("Expecting ':' delimiter")
+        self.pos += 1
+        return key
+
+    def __iter__(self):
+        stack = []  # '{' or '[' for each open container
+        expectValue = True
+        while (True):
+            c = self.skipSpace()
+            if (not c):
+                if (stack): self.fail("Unexpected end of input")
+                return
+            if (not expectValue):                # After a value
+                expectValue = True
+                if (not stack): continue         # Next top-level value
+                self.pos += 1
+                if (c == ','):
+                    if (stack[-1] == '{'): yield ('map_key', self.readKey())
+                elif (c == '}' and stack[-1] == '{'):
+                    stack.pop()
+                    yield ('end_map', None)
+                    expectValue = False
+                elif (c == ']' and stack[-1] == '['):
+                    stack.pop()
+                    yield ('end_array', None)
+                    expectValue = False
+                else:
+                    self.pos -= 1
+                    self.fail("Expecting ',' delimiter")
+            elif (c == '{'):
+                self.pos += 1
+                yield ('start_map', None)
+                if (self.skipSpace() == '}'):
+                    self.pos += 1
+                    yield ('end_map', None)
+                    expectValue = False
+                else:
+                    stack.append('{')
+                    yield ('map_key', self.readKey())
+            elif (c == '['):
+                self.pos += 1
+                yield ('start_array', None)
+                if (self.skipSpace() == ']'):
+                    self.pos += 1
+                    yield ('end_array', None)
+                    expectValue = False
+                else:
+                    stack.append('[')
+            elif (c == '"'):
+                yield ('scalar', self.readString())
+                expectValue = False
+            else:
+                yield ('scalar', self.readAtom())
+                expectValue = False
+
+def iterXmlFromEvents(events, istring='    ', depth=0):
+    """Generate the same XML as iterXml() would for the data, but from
+    JsonEventReader events rather than Python objects. Each top-level value is
+    followed by a newline.
+    """
+    stack = []  # (isDict, depth) for each open container
+    for event, value in events:
+        if (event == 'map_key'):
+            if (istring): yield "\n" + (istring * (stack[-1][1] + 1))
+            yield ditemStart(value)
+            continue
+        if (event == 'end_map' or event == 'end_array'):
+            isDict, d = stack.pop()
+            if (isDict):
+                if (istring): yield "\n" + (istring * d)
+                yield "</dict>"
+            else:
+                yield "</list>"
+        else:                                   # Some value starts here
+            if (not stack):
+                d = depth
+            elif (stack[-1][0]):
+                d = stack[-1][1] + 2
+            else:
+                d = stack[-1][1] + 1
+                if (istring): yield "\n" + (istring * d)
+            if (event == 'start_map'):
+                if (istring): yield "\n" + (istring * d)
+                yield "<dict>"
+                stack.append((True, d))
+                continue
+            if (event == 'start_array'):
+                if (istring): yield "\n" + (istring * d)
+                yield "<list>"
+                stack.append((False, d))
+                continue
+            yield xmlHandlerFor(type(value))(value, d, None)
+        # A value has just ended
+        if (not stack):
+            yield "\n"
+        elif (stack[-1][0]):
+            yield "</ditem>"
+
+
+###############################################################################
+# JSON Lines (NDJSON): one JSON record per line. The records are converted
+# in chunks of lines (in parallel if requested), and wrapped in a single
+# <list>, giving the same XML as a JSON array of the records would.
+#
+def ndjsonChunk2xml(job):
+    """Convert a chunk of JSON Lines, given as
+    (firstLineNumber, lines, istring, tables, rle), to XML for the items of a
+    top-level list. Bad lines are reported, and skipped.
+    """
+    lineNum, lines, istring, tables, rle = job
+    buf = []
+    for rec in lines:
+        if (rec.strip()):
+            try:
+                pyObject = json.loads(rec)
+            except json.decoder.JSONDecodeError as e:
+                lg.vMsg(0, "Bad JSON at line %d: %s" % (lineNum, e))
+            else:
+                if (istring): buf.append("\n" + istring)
+                buf.append(serialize2xml(pyObject, istring=istring, depth=1,
+                    tables=tables, rle=rle))
+        lineNum += 1
+    return "".join(buf)
+
+def openNdjson(path, encoding='utf-8'):
+    """Open a JSON Lines file, so that it splits only at real line-breaks.
+    (codecs.open() also splits at U+2028, U+2029, and U+0085, which may occur
+    raw inside JSON strings.)
+    """
+    return open(path, "r", encoding=encoding, newline="")
+
+def iterNdjsonXml(fh, istring='    ', jobs=1, chunkLines=1000, tables=False,
+    rle=False):
+    """Generate XML for a file of JSON Lines, as a series of strings.
+    With `jobs` > 1, chunks of `chunkLines` lines are converted by a pool of
+    processes, and the results are still generated in order.
+    """
+    def getJobs():
+        lineNum = 1
+        while (True):
+            lines = list(itertools.islice(fh, chunkLines))
+            if (not lines): return
+            yield (lineNum, lines, istring, tables, rle)
+            lineNum += len(lines)
+
+    if (istring): yield "\n"
+    yield "<list>"
+    if (jobs <= 1):
+        for job in getJobs(): yield ndjsonChunk2xml(job)
     else:
-        lg.vMsg(0, "Unknown type for export: %s." % (type(pyObject)))
+        with multiprocessing.Pool(jobs) as pool:
+            for chunk in pool.imap(ndjsonChunk2xml, getJobs()):
+                yield chunk
+    yield "</list>\n"
+
+
+###############################################################################
+# Converting whole directory trees (--outdir): each input file gets an output
+# file at the same relative place under the output directory. The files are
+# converted by a pool of processes, and files that haven't changed since the
+# last run are skipped, judged either by modification times, or by a
+# manifest of input sizes, times, and content hashes kept in the output
+# directory (which also notices when the conversion options change).
+#
+MANIFEST_NAME = ".json2xml-manifest.json"
+
+outputExtensions = {
+    'xml':      ".xml",
+    'json':     ".json",
+    'report':   ".txt",
+    'binary':   ".j2xb",
+}
+
+def convertFile(inPath, outPath, iformat='json', iencoding='utf-8',
+    ndjson=False, oformat='xml', istring='    ', tables=False, rle=False):
+    """Convert the file at `inPath`, writing the result to `outPath` (and
+    making any directories that needs). The output is written to a temporary
+    file and then renamed, so there's never a partial output file that's
+    newer than its input. `ndjson` only works with `oformat` 'xml'.
+    """
+    if (ndjson and oformat != 'xml'):
+        raise ValueError("ndjson input only converts to oformat 'xml'.")
+    outDir = os.path.dirname(outPath)
+    if (outDir): os.makedirs(outDir, exist_ok=True)
+    tmpPath = "%s.tmp%d" % (outPath, os.getpid())
+    try:
+        if (iformat == 'binary'):
+            with open(inPath, "rb") as ifh: pyObject = loadBinary(ifh)
+        elif (ndjson):
+            pyObject = None
+        else:
+            with codecs.open(inPath, "rb", encoding=iencoding) as ifh:
+                pyObject = loadXml(ifh) if (iformat == 'xml') else json.load(ifh)
+
+        if (oformat == 'binary'):
+            with open(tmpPath, "wb") as ofh: writeBinary(pyObject, ofh)
+        else:
+            with codecs.open(tmpPath, "wb", encoding="utf-8") as ofh:
+                if (ndjson):
+                    with openNdjson(inPath, iencoding) as ifh:
+                        writeChunks(iterNdjsonXml(ifh, istring=istring,
+                            tables=tables, rle=rle), ofh)
+                elif (oformat == 'xml'):
+                    writeXml(pyObject, ofh, istring=istring,
+                        tables=tables, rle=rle)
+                    ofh.write("\n")
+                elif (oformat == 'json'):
+                    json.dump(pyObject, ofh, indent=len(istring))
+                    ofh.write("\n")
+                else:
+                    ofh.write(lg.formatRec(pyObject) + "\n")
+        os.replace(tmpPath, outPath)
+    finally:
+        if (os.path.exists(tmpPath)): os.remove(tmpPath)
+
+def fileDigest(path, blockSize=1<<20):
+    import hashlib
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(blockSize), b""): h.update(block)
+    return h.hexdigest()
+
+def convertTreeJob(job):
+    """Convert one file for convertTree(), unless it's up to date. `job` is
+    (inPath, outPath, relPath, skipBy, previous manifest entry or None,
+    options). Return (relPath, status, new manifest entry, message), where
+    status is "converted", "skipped", or "failed".
+    """
+    inPath, outPath, relPath, skipBy, old, options = job
+    st = os.stat(inPath)
+    entry = { "size": st.st_size, "mtime": st.st_mtime, "options": options }
+    outExists = os.path.exists(outPath)
+    if (outExists and skipBy == 'mtime'):
+        if (os.path.getmtime(outPath) >= st.st_mtime):
+            return relPath, "skipped", entry, None
+    elif (outExists and skipBy == 'hash' and old and
+        old.get("options") == options):
+        if (old["size"] == st.st_size and old["mtime"] == st.st_mtime):
+            return relPath, "skipped", old, None
+        if (old["size"] == st.st_size):
+            entry["sha256"] = fileDigest(inPath)
+            if (entry["sha256"] == old.get("sha256")):
+                return relPath, "skipped", entry, None
+    try:
+        convertFile(inPath, outPath, **options)
+    except (IOError, OSError, ValueError, SyntaxError) as e:
+        return relPath, "failed", None, str(e)
+    if (skipBy == 'hash' and "sha256" not in entry):
+        entry["sha256"] = fileDigest(inPath)
+    return relPath, "converted", entry, None
+
+def convertTree(files, outdir, jobs=1, skipBy='mtime', **options):
+    """Convert each of `files`, a list of (inPath, relPath) pairs, to
+    `outdir`/`relPath` with its extension changed to suit
+    `options["oformat"]`, using `jobs` processes (see convertTreeJob()).
+    `skipBy` is "mtime", "hash", or "none". Keyword options are as for
+    convertFile(). Return a dict of how many files had each status.
+    """
+    oformat = options.get("oformat", "xml")
+    if (options.get("ndjson") and oformat != 'xml'):
+        raise ValueError("ndjson input only converts to oformat 'xml'.")
+    manifestPath = os.path.join(outdir, MANIFEST_NAME)
+    manifest = {}
+    if (skipBy == 'hash' and os.path.exists(manifestPath)):
+        with open(manifestPath, "r", encoding="utf-8") as mfh:
+            manifest = json.load(mfh)
+
+    todo = []
+    for inPath, relPath in files:
+        outPath = os.path.join(outdir,
+            os.path.splitext(relPath)[0] + outputExtensions[oformat])
+        todo.append((inPath, outPath, relPath, skipBy, manifest.get(relPath),
+            options))
+
+    counts = { "converted": 0, "skipped": 0, "failed": 0 }
+    newManifest = {}
+    def record(result):
+        relPath, status, entry, msg = result
+        counts[status] += 1
+        if (msg): lg.vMsg(0, "Failed to convert %s:\n    %s" % (relPath, msg))
+        else: lg.vMsg(1, "%s: %s" % (status, relPath))
+        if (entry): newManifest[relPath] = entry
+
+    if (jobs <= 1):
+        for job in todo: record(convertTreeJob(job))
+    else:
+        with multiprocessing.Pool(jobs) as pool:
+            for result in pool.imap_unordered(convertTreeJob, todo):
+                record(result)
+
+    if (skipBy == 'hash'):
+        os.makedirs(outdir, exist_ok=True)
+        tmpPath = manifestPath + ".tmp"
+        with open(tmpPath, "w", encoding="utf-8") as mfh:
+            json.dump(newManifest, mfh, indent=1, sort_keys=True)
+        os.replace(tmpPath, manifestPath)
+    return counts
+
+
+###############################################################################
+# Shape inference. A list whose items are all plain dicts with the same keys
+# (in the same order), and scalar values of consistent types, is in effect a
+# table of records. tableShape() finds that in one pass over the list, and the
+# table can then be written much more compactly (see table2xml()).
+#
+# The attribute form needs keys that can be XML attribute names; we
+# use identifiers (see dictKeysAreIdentifiers()).
+#
+scalarTypeCodes = {
+    int: 'i', bool: 'i', float: 'f', str: 'u', type(None): 'None',
+}
+# For each type code, the attribute value format, and a converter back.
+scalarFormats = {
+    'i':    ("%d", int),
+    'f':    ("%s", float),
+    'u':    ("%s", str),
+    'None': ("%s", None),
+}
+
+# Columns whose values need converting to strings first.
+attrConverters = {
+    'f':    floatStr,
+    'u':    escapeAttribute,
+}
+
+def tableShape(l1, minRows=2):
+    """If `l1` is a list of at least `minRows` records that could be written
+    as a table, return (keys, typeCodes), both tuples, in the first record's
+    order. Otherwise return None.
+    A column may be null in some rows; its type is that of the others.
+    """
+    if (len(l1) < minRows): return None
+    first = l1[0]
+    if (first.__class__ is not dict or not first): return None
+    keys = tuple(first.keys())  # The record signature, computed once
+    if (not dictKeysAreIdentifiers(first)): return None
+    for k in keys:
+        if (k.lower().startswith("xml")): return None  # Reserved in XML
+    nCols = len(keys)
+    types = [ 'None' ] * nCols
+    codes = scalarTypeCodes
+    for rec in l1:
+        if (rec.__class__ is not dict or len(rec) != nCols): return None
+        if (rec is not first and tuple(rec.keys()) != keys): return None
+        for i, v in enumerate(rec.values()):
+            code = codes.get(v.__class__)
+            if (code is None): return None          # Not a scalar
+            if (code == 'u' and xmlIllegalExpr.search(v)): return None
+            if (code != types[i]):
+                if (types[i] == 'None'): types[i] = code
+                elif (code != 'None'): return None  # Inconsistent types
+    return keys, tuple(types)
 
 
 ###############################################################################
@@ -425,21 +1724,19 @@ def serialize2xml(pyObject, istring='    ', depth=0):
 def tuplesMatch(t1, t2, checkValueTypes=True):
     assert (isinstance(t1, tuple))
     assert (isinstance(t2, tuple))
-    if (len(t1) != len(t1)): return False
+    if (len(t1) != len(t2)): return False
     if (not checkValueTypes): return True
-    for i in range(len(t1)):
-        if (type(t1[i]) != type(t2[i])): return False
+    for v1, v2 in zip(t1, t2):
+        if (type(v1) != type(v2)): return False
     return True
 
 def dictsMatch(d1, d2, checkValueTypes=True):
     assert (isinstance(d1, dict))
     assert (isinstance(d2, dict))
-    keySeq1 = sorted(d1.keys())
-    keySeq2 = sorted(d2.keys())
-    if (keySeq1 != keySeq2): return False
+    if (d1.keys() != d2.keys()): return False  # Compares as sets, no sorting
     if (checkValueTypes):
-        for k in keySeq1:
-            if (type(d1[k]) != type(d2[k])): return False
+        for k, v in d1.items():
+            if (type(v) != type(d2[k])): return False
     return True
 
 def listsMatch(l1, l2, checkValueTypes=True, checkLengths=True):
@@ -449,10 +1746,10 @@ def listsMatch(l1, l2, checkValueTypes=True, checkLengths=True):
     """
     assert (isinstance(l1, list))
     assert (isinstance(l2, list))
-    if (checkLengths and len(l1) != len(l1)): return False
+    if (checkLengths and len(l1) != len(l2)): return False
     if (checkValueTypes):
-        for i in range(len(l1)):
-            if (type(l1[i]) != type(l2[i])): return False
+        for v1, v2 in zip(l1, l2):
+            if (type(v1) != type(v2)): return False
     return True
 
 def objectsMatch(o1, o2, checkValueTypes=True, checkExactClass=True):
@@ -460,13 +1757,7 @@ def objectsMatch(o1, o2, checkValueTypes=True, checkExactClass=True):
     assert (isinstance(o2, object))
     if (checkExactClass and type(o1).__name__ != type(o2).__name__):
         return False
-    keySeq1 = sorted(o1.__dict__.keys())
-    keySeq2 = sorted(o2.__dict__.keys())
-    if (keySeq1 != keySeq2): return False
-    if (checkValueTypes):
-        for k in keySeq1:
-            if (type(o1.__dict__[k]) != type(o2.__dict__[k])): return False
-    return True
+    return dictsMatch(o1.__dict__, o2.__dict__, checkValueTypes)
 
 
 def dictKeysAreIdentifiers(pyObject, PythonKeyWordsOk=True):
@@ -477,18 +1768,63 @@ def dictKeysAreIdentifiers(pyObject, PythonKeyWordsOk=True):
     for k in pyObject.keys():
         if (type(k) != str): return False
         if (not str.isidentifier(k)): return False
-        if (not PythonKeyWordsOk and keyword.iskeyword()): return False
+        if (not PythonKeyWordsOk and keyword.iskeyword(k)): return False
     return True
 
 def isListHomogeneous(l1):
     assert (isinstance(l1, list))
     if (len(l1) == 0): return True
     type0 = type(l1[0])
-    for i in range(1, len(l1)):
-        if (type(l1[i]) != type0): return False
+    for v in l1:
+        if (type(v) != type0): return False
     return True
 
 
+###############################################################################
+# Self-test (--test): round-trip some awkward data through each form.
+#
+selfTestData = {
+    "plain": [ 1, -2.5, 0.0, -0.0, None, "", "a < b & c ]]> d\r\n\t" ],
+    "controls": [ "form\ffeed", "back\bspace", "nul\x00", "\x1f\\u0041\\",
+        "lone \ud800", "\ufffe\uffff" ],
+    "key\fwith\x01controls": { "\x7f\\": "ok" },
+    "rows": [ { "id": i, "name": "row\b%d" % (i), "x": i / 4.0 }
+        for i in range(3) ],
+    "runs": [ "\f" ] * 4 + [ [ 0.0 ] ] * 3 + [ [ -0.0 ] ] * 3,
+}
+
+def selfTest():
+    """Write selfTestData in each form and read it back. Report each result,
+    and return how many failed.
+    """
+    import io
+    data = selfTestData
+    checks = []
+    for tables in (False, True):
+        for rle in (False, True):
+            xml = serialize2xml(data, tables=tables, rle=rle).encode("utf-8")
+            checks.append(("xml tables=%s rle=%s" % (tables, rle),
+                lambda xml=xml: loadXml(io.BytesIO(xml))))
+    checks.append(("xml stream", lambda: loadXml(io.BytesIO("".join(
+        iterXmlFromEvents(JsonEventReader(io.StringIO(json.dumps(data)))))
+        .encode("utf-8")))))
+    checks.append(("binary",
+        lambda: loadBinary(io.BytesIO(serialize2binary(data)))))
+    expected = json.dumps(data)
+    nFailed = 0
+    for name, load in checks:
+        try:
+            got = json.dumps(load())
+            ok = (got == expected)
+        except Exception as e:
+            got, ok = "%s: %s" % (e.__class__.__name__, e), False
+        print("%-24s %s" % (name, "ok" if (ok) else "FAILED"))
+        if (not ok):
+            nFailed += 1
+            lg.vMsg(1, "    got %s" % (got[0:200]))
+    return nFailed
+
+
 ###############################################################################
 # Main
 #
@@ -503,12 +1839,28 @@ if __name__ == "__main__":
         except ImportError:
             parser = argparse.ArgumentParser(description=descr)
 
+        parser.add_argument(
+            "--benchmark", action='store_true',
+            help='Compare size and speed of the output forms, for each file.')
+        parser.add_argument(
+            "--chunkLines", type=int, metavar='N', default=1000,
+            help='With --ndjson, hand out lines to workers N at a time.')
+        parser.add_argument(
+            "--iformat", type=str, default='json',
+            choices=[ 'json', 'xml', 'binary' ],
+            help='Read input in this form (xml means as written by this). Default: json.')
         parser.add_argument(
             "--iencoding",        type=str, metavar='E', default="utf-8",
             help='Assume this character coding for input. Default: utf-8.')
         parser.add_argument(
             "--istring", type=str, default='    ',
             help='Repeat this string to indent the output.')
+        parser.add_argument(
+            "--jobs", "-j", type=int, metavar='N', default=1,
+            help='With --ndjson or --outdir, convert using a pool of N processes.')
+        parser.add_argument(
+            "--ndjson", "--jsonl", action='store_true',
+            help='Input is JSON Lines (one record per line); write XML.')
         parser.add_argument(
             "--noprop", action='store_true',
             help='Untag the "pyxs:prop" element surrounding data atoms.')
@@ -523,17 +1875,36 @@ if __name__ == "__main__":
             help='Delete the "type" attribute everywhere.')
         parser.add_argument(
             "--oformat", type=str, default='xml',
-            choices=[ 'xml', 'json', 'report' ],
+            choices=[ 'xml', 'json', 'report', 'binary' ],
             help='Write the output to this form. Default: xml.')
+        parser.add_argument(
+            "--outdir", type=str, metavar='DIR', default=None,
+            help='Write each file\'s output to the same relative place under DIR.')
         parser.add_argument(
             "--pad", type=int,
             help='Left-pad integers to this many columns.')
         parser.add_argument(
             "--quiet", "-q", action='store_true',
             help='Suppress most messages.')
+        parser.add_argument(
+            "--rle", action='store_true',
+            help='Write runs of the same list item once, plus <repeat n="k"/>.')
+        parser.add_argument(
+            "--skipBy", type=str, default='mtime',
+            choices=[ 'mtime', 'hash', 'none' ],
+            help='With --outdir, how to tell a file needs no redoing. Default: mtime.')
         parser.add_argument(
             "--sortkeys", "--sort_keys", "--sort-keys", action='store_true',
             help='Delete the "type" attribute everywhere.')
+        parser.add_argument(
+            "--stream", action='store_true',
+            help='Convert to XML as the JSON is read, without loading it all.')
+        parser.add_argument(
+            "--tables", action='store_true',
+            help='Write lists of same-shaped records as <table> of <row>s.')
+        parser.add_argument(
+            "--test", action='store_true',
+            help='Run a round-trip self-test, then exit.')
         parser.add_argument(
             "--verbose", action='count', default=0,
             help='Add more messages (repeatable).')
@@ -547,6 +1918,10 @@ if __name__ == "__main__":
         args0 = parser.parse_args()
 
         lg.setVerbose(args0.verbose)
+        if (args0.ndjson and (args0.oformat != 'xml' or args0.benchmark)):
+            lg.vMsg(0, "--ndjson only applies to --oformat xml, "
+                "without --benchmark.")
+            sys.exit(1)
         if (os.environ["PYTHONIOENCODING"] != "utf_8"):
             lg.vMsg(0, "Warning: PYTHONIOENCODING is not utf_8.")
         return args0
@@ -557,22 +1932,75 @@ if __name__ == "__main__":
         """
         if (not path):
             if (sys.stdin.isatty()): print("Waiting on STDIN...")
-            fh = sys.stdin
+            fh = sys.stdin.buffer if (args.iformat == 'binary') else sys.stdin
         else:
             try:
-                fh = codecs.open(path, "rb", encoding=args.iencoding)
+                if (args.iformat == 'binary'): fh = open(path, "rb")
+                elif (args.ndjson): fh = openNdjson(path, args.iencoding)
+                else: fh = codecs.open(path, "rb", encoding=args.iencoding)
             except IOError as e:
-                lg.vMsg(0, "Cannot open '%s':\n    %s" % (e))
+                lg.vMsg(0, "Cannot open '%s':\n    %s" % (path, e))
                 return 0
 
+        if (args.iformat == 'binary'):
+            try:
+                pyObject0 = loadBinary(fh)
+            except ValueError as e:
+                lg.vMsg(0, "Binary load failed for %s:\n    %s" % (path, e))
+                sys.exit()
+            writeOutput(path, pyObject0)
+            return
+
+        if (args.iformat == 'xml'):
+            try:
+                pyObject0 = loadXml(fh)
+            except (ValueError, SyntaxError) as e:
+                lg.vMsg(0, "XML load failed for %s:\n    %s" % (path, e))
+                sys.exit()
+            writeOutput(path, pyObject0)
+            return
+
+        if (args.ndjson):
+            writeChunks(iterNdjsonXml(fh, istring=args.istring,
+                jobs=args.jobs, chunkLines=args.chunkLines,
+                tables=args.tables, rle=args.rle), sys.stdout)
+            return
+
+        if (args.stream and args.oformat == 'xml'):
+            try:
+                writeChunks(iterXmlFromEvents(JsonEventReader(fh),
+                    istring=args.istring), sys.stdout)
+            except json.decoder.JSONDecodeError as e:
+                lg.vMsg(0, "JSON read failed for %s:\n    %s" % (path, e))
+                sys.exit()
+            return
+
         try:
             pyObject0 = json.load(fh)
         except json.decoder.JSONDecodeError as e:
             lg.vMsg(0, "JSON load failed for %s:\n    %s" % (path, e))
             sys.exit()
-
+        if (args.benchmark):
+            print("%s:" % (path))
+            for form, nBytes, tWrite, tRead in compareFormats(pyObject0):
+                print("    %-8s %12d bytes  write %8.3fs  read %8.3fs" % (
+                    form, nBytes, tWrite, tRead))
+            return
+        writeOutput(path, pyObject0)
+
+    def writeOutput(path, pyObject0):
+        """Write out the data loaded from `path`, in the --oformat form.
+        """
         if (args.oformat == 'xml'):
-            buf = serialize2xml(pyObject0, istring=args.istring)
+            writeXml(pyObject0, sys.stdout, istring=args.istring,
+                tables=args.tables, rle=args.rle)
+            print("")
+            return
+        elif (args.oformat == 'binary'):
+            sys.stdout.flush()
+            writeBinary(pyObject0, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+            return
         elif (args.oformat == 'json'):
             buf = json.dumps(pyObject0,
                 sort_keys=args.sortkeys, indent=len(args.istring))
@@ -589,7 +2017,29 @@ if __name__ == "__main__":
     #
     args = processOptions()
 
-    if (len(args.files) == 0):
+    if (args.test):
+        sys.exit(1 if (selfTest()) else 0)
+    if (args.outdir):
+        outdirReal = os.path.realpath(args.outdir) + os.sep
+        treeFiles = []
+        for fArg in args.files:
+            pw = PowerWalk([ fArg ], open=False, close=False,
+                encoding=args.iencoding)
+            pw.setOptionsFromArgparse(args)
+            for path0, fh0, what0 in pw.traverse():
+                if (what0 != PWType.LEAF): continue
+                if (os.path.realpath(path0).startswith(outdirReal)): continue
+                if (os.path.isdir(fArg)): rel0 = os.path.relpath(path0, fArg)
+                else: rel0 = os.path.basename(path0)
+                treeFiles.append((path0, rel0))
+        counts0 = convertTree(treeFiles, args.outdir, jobs=args.jobs,
+            skipBy=args.skipBy, iformat=args.iformat, iencoding=args.iencoding,
+            ndjson=args.ndjson, oformat=args.oformat, istring=args.istring,
+            tables=args.tables, rle=args.rle)
+        if (not args.quiet):
+            lg.vMsg(0, "Converted %d, skipped %d (up to date), failed %d." % (
+                counts0["converted"], counts0["skipped"], counts0["failed"]))
+    elif (len(args.files) == 0):
         lg.vMsg(0, "json2xml.py: No files specified....")
         doOneFile(None)
     else:
@@ -7,7 +7,13 @@ from __future__ import print_function
 import sys, os
 import argparse
 import re
-import codecs
+import itertools
+import functools
+from collections import namedtuple
+import heapq
+import tempfile
+import shutil
+import multiprocessing
 
 from alogging import ALogger
 lg = ALogger(1)
@@ -20,7 +26,7 @@ __metadata__ = {
     "type"         : "http://purl.org/dc/dcmitype/Software",
     "language"     : "Python 3.7",
     "created"      : "2018-07-18",
-    "modified"     : "2021-03-03",
+    "modified"     : "2026-10-15",
     "publisher"    : "http://github.com/sderose",
     "license"      : "https://creativecommons.org/licenses/by-sa/3.0/"
 }
@@ -32,6 +38,73 @@ descr = """
 
 *nix C<sort> is a little weird, so do something straughtforward, without locale.
 
+Each file is sorted separately, and written to stdout.
+
+==Big files==
+
+Input doesn't have to fit in memory. Records are read until they'd take
+about `--memory` bytes (default 512M; suffixes K, M, and G are allowed).
+If there are more, each batch is sorted and written to a temporary file (a
+"run", in `--tempDir`, or the system default), and at the end all the runs
+are merged (with a heap, so the merge takes little memory). If there are
+more than 64 runs, they are first merged in groups. The result is the same
+as sorting in memory: in particular, records with equal keys stay in their
+original order.
+
+Use `--parallel N` to sort with a pool of N processes. The file is cut
+into at least N chunks (at line boundaries), each small enough for a worker
+to sort in about `--memory`/N; each worker reads its chunk straight from the
+file, sorts it, and writes it out as a run; and then the runs are merged.
+STDIN is instead read in blocks that are handed to the workers.
+This needs an input encoding (such as UTF-8, or any ASCII superset) in which
+a newline byte is always a newline.
+
+Records end at newline (\\n) characters only.
+
+==Keys==
+
+`--delim` is a regex, but is compiled just once; and if it has no regex
+special characters, plain string splitting is used instead (which is much
+faster). Each record's key is made just once per sort. With `--numeric`,
+if NumPy is installed the keys go into an array, which is sorted (stably)
+with `argsort`.
+
+Use `--key SPEC` (or `-k`) to sort on particular fields or parts of fields;
+repeat it to sort on several keys, in order of priority. SPEC is:
+
+    [FIELD][.START[:END]][FLAGS]
+
+FIELD counts from 0 as for `--field`, and defaults to the whole record.
+A negative FIELD counts from the end (write it as `--key=-1`, so it's not
+taken for an option). START and END pick characters from the field
+just like a Python slice (so `3.0:4` is the first 4 characters of field 3,
+and `.-2` is the last 2 characters of the record). FLAGS are any of `n`
+(numeric), `i` (ignore case), and `r` (reverse), and apply to just that
+key; a key with no flags gets `--numeric` and `--ignoreCase` (but not
+`--reverse`, which reverses the result as a whole). For example:
+
+    sort.py -k 2n -k 0ir -k 1.0:3 data.tsv
+
+sorts numerically by field 2, then descending by field 0 ignoring case, then
+by the first 3 characters of field 1. All the keys are put into a single
+tuple per record, and each record is split into fields just once.
+If `--key` is given, `--field` is ignored.
+
+==Bytes==
+
+With `--bytes`, records are read, compared, and written as raw bytes, and
+are never decoded to strings, which saves decoding time and memory. But
+CPython compares bytes a bit more slowly than it does ASCII strings, so this
+is faster for sorting whole records, and can be slower for sorting by fields. For UTF-8, byte order is the same as code point order,
+so the result is the same as without `--bytes`, except:
+
+* `--ignoreCase` folds only ASCII letters (using a precomputed
+`bytes.translate()` table);
+* invalid UTF-8 is simply sorted, rather than being an error.
+
+`--delim` is encoded with `--iencoding` (so it must be a regex that works
+on the encoded bytes).
+
 
 =Related Commands=
 
@@ -40,15 +113,24 @@ descr = """
 
 =Known bugs and Limitations=
 
-Can't specify *parts* of fields or multiple fields.
+Mixing reversed and non-reversed string keys is slower than not.
+
+The memory budget is approximate (it counts characters, plus a guess at
+Python's overhead per record).
 
-Limited to memory size.
+A last line with no line-break gets one.
 
 
 =History=
 
   2018-07-18: Written by Steven J. DeRose.
   2021-03-03: New layout.
+  2026-10-15: Add external merge sort, --memory, --tempDir. Sort the whole
+record if there's no --field. Fix reading STDIN, and double-spaced output.
+Add --parallel. Make each key just once (with NumPy if available and
+--numeric), without re-parsing `--delim`. Fix --ignoreCase. Add --key,
+with multiple keys and parts of fields. Add --bytes. Drop the "_" that
+was put on the front of every key.
 
 
 =Rights=
@@ -76,6 +158,9 @@ def processOptions():
     except ImportError:
         parser = argparse.ArgumentParser(description=descr)
 
+    parser.add_argument(
+        "--bytes", action='store_true',
+        help='Sort the raw bytes, without decoding (see "Bytes").')
     parser.add_argument(
         "--color",  # Don't default. See below.
         help='Colorize the output.')
@@ -83,23 +168,35 @@ def processOptions():
         "--delim", "-d", "-t", "--fieldSep", type=str, default="\t",
         help='Use this (regex) as the field delimiter.')
     parser.add_argument(
-        "--field", "-f", "-k", type=int, default=None,
-        help='Use this (regex) as the field delimiter.')
+        "--field", "-f", type=int, default=None,
+        help='Sort on this field (counting from 0). Default: the whole record.')
     parser.add_argument(
         "--iencoding",        type=str, metavar='E', default="utf-8",
         help='Assume this character set for input files. Default: utf-8.')
     parser.add_argument(
         "--ignoreCase", "-i", action='store_true',
         help='Disregard case distinctions.')
+    parser.add_argument(
+        "--key", "-k", type=str, metavar='SPEC', action='append', default=None,
+        help='Sort on this key (see "Keys"). Repeatable.')
+    parser.add_argument(
+        "--memory", "-S", type=str, metavar='SIZE', default="512M",
+        help='Sort about this much at a time (e.g. 100M, 2G). Default: 512M.')
     parser.add_argument(
         "--numeric", "-n", "-g", action='store_true',
         help='Do numeric comparison (incl. floats), instead of string.')
+    parser.add_argument(
+        "--parallel", "-P", type=int, metavar='N', default=1,
+        help='Sort using a pool of N processes.')
     parser.add_argument(
         "--quiet", "-q",      action='store_true',
         help='Suppress most messages.')
     parser.add_argument(
         "--reverse", "-r",    action='store_true', default=False,
         help='Sort in descending order.')
+    parser.add_argument(
+        "--tempDir", "-T", type=str, metavar='DIR', default=None,
+        help='Put temporary files here. Default: the system temp directory.')
     parser.add_argument(
         "--tickInterval",     type=int, metavar='N', default=10000,
         help='Report progress every n records.')
@@ -123,63 +220,433 @@ def processOptions():
         args0.color = ("USE_COLOR" in os.environ and sys.stderr.isatty())
     lg.setColors(args0.color)
     if (args0.verbose): lg.setVerbose(args0.verbose)
+    try:
+        args0.memory = parseSize(args0.memory)
+        if (args0.key):
+            args0.keySpecs = [ parseKeySpec(k, args0.numeric, args0.ignoreCase)
+                for k in args0.key ]
+        else:
+            args0.keySpecs = [ KeySpec(args0.field, None, None,
+                args0.numeric, args0.ignoreCase, False) ]
+    except ValueError as e:
+        lg.error(str(e))
+        sys.exit(1)
+    if (all(k.descending for k in args0.keySpecs)):  # Faster as one reverse
+        args0.keySpecs = [ k._replace(descending=False)
+            for k in args0.keySpecs ]
+        args0.reverse = not args0.reverse
     return(args0)
 
+def parseSize(s):
+    """Turn a size like "100000", "64K", "512M", or "2G" into bytes.
+    """
+    mat = re.match(r'^\s*(\d+(\.\d+)?)\s*([KMG]?)B?\s*$', s, re.I)
+    if (not mat): raise ValueError("Bad size '%s'." % (s))
+    power = " KMG".index(mat.group(3).upper() or " ")
+    return int(float(mat.group(1)) * 1024 ** power)
+
 
 ###############################################################################
 #
 def doOneFile(path, fhp):
     """Read and deal with one individual file.
     """
-    recs = fhp.readlines()
-    lg.vMsg(1, "File read: %s" % (path))
-    if (args.numeric):
-        recs.sort(key=getKeyNumeric, reverse=args.reverse)
-    elif (args.ignoreCase):
-        recs.sort(key=getKeyLower, reverse=args.reverse)
+    lg.vMsg(1, "Sorting: %s" % (path))
+    ofh = sys.stdout.buffer if (args.bytes) else sys.stdout
+    if (args.parallel > 1):
+        isStdin = fhp in (sys.stdin, sys.stdin.buffer)
+        sortFileParallel(None if (isStdin) else path, ofh,
+            args.parallel, reverse=args.reverse, memory=args.memory,
+            tempDir=args.tempDir, binary=args.bytes)
+        return
+    sortFile(fhp, ofh, key=getKeyFunction(), reverse=args.reverse,
+        numeric=isNumericKey(args.keySpecs), memory=args.memory,
+        tempDir=args.tempDir, binary=args.bytes)
+    return
+
+def getKeyFunction():
+    if (args.bytes):
+        return makeKeyFunction(args.keySpecs,
+            delim=args.delim.encode(args.iencoding), binary=True)
+    return makeKeyFunction(args.keySpecs, delim=args.delim)
+
+
+###############################################################################
+# Keys. Each --key is parsed to a KeySpec; then they're all compiled into
+# one key function, which returns a tuple if there's more than one key.
+#
+KeySpec = namedtuple("KeySpec",
+    [ "field", "start", "end", "numeric", "ignoreCase", "descending" ])
+
+def parseKeySpec(spec, numeric=False, ignoreCase=False):
+    """Parse a --key like "2", "-1n", "3.0:4", or ".2:ir" (see "Keys" in
+    the help). The flags default to `numeric` and `ignoreCase`, unless the
+    spec has flags of its own.
+    """
+    mat = re.match(r'^(-?\d+)?(?:\.(-?\d*)(?::(-?\d*))?)?([nir]*)$', spec)
+    if (not mat): raise ValueError("Bad key spec '%s'." % (spec))
+    field, start, end, flags = mat.groups()
+    if (flags):
+        numeric = "n" in flags
+        ignoreCase = "i" in flags
+    return KeySpec(
+        None if (field is None) else int(field),
+        int(start) if (start) else None,
+        int(end) if (end) else None,
+        numeric, ignoreCase, "r" in flags)
+
+def isNumericKey(keySpecs):
+    """Does the key function for `keySpecs` return plain floats?
+    """
+    return (len(keySpecs) == 1 and keySpecs[0].numeric)
+
+class Descending:
+    """Wrap a key so it sorts backwards, for keys that are reversed when
+    other keys aren't (numeric keys are just negated instead).
+    """
+    __slots__ = [ "key" ]
+    def __init__(self, key):
+        self.key = key
+    def __lt__(self, other):
+        return other.key < self.key
+    def __eq__(self, other):
+        return self.key == other.key
+
+REGEX_SPECIALS = set(".^$*+?{}[]\\|()")
+
+def makeSplitter(delim="\t", maxField=-1):
+    """Return a function that splits a record into fields at the regex `delim`.
+    The regex is compiled just once, and if it's really just a literal string,
+    uses the (much faster) str.split() instead. If `maxField` isn't -1,
+    nothing after that field is split.
+    """
+    maxsplit = -1 if (maxField < 0) else maxField + 1
+    chars = delim.decode("latin-1") if (isinstance(delim, bytes)) else delim
+    if (not REGEX_SPECIALS.intersection(chars)):
+        return lambda rec: rec.split(delim, maxsplit)
+    return functools.partial(re.compile(delim).split,
+        maxsplit=max(maxsplit, 0))
+
+def makeFieldGetter(field=None, delim="\t", binary=False):
+    """Return a function that extracts field number `field` (or the whole
+    record if None) from a record, or raises IndexError if there isn't one.
+    """
+    eol = b"\r\n" if (binary) else "\r\n"
+    if (field is None):
+        return lambda rec: rec.rstrip(eol)
+    split = makeSplitter(delim, field)
+    return lambda rec: split(rec.rstrip(eol))[field]
+
+def makeConverter(keySpec, binary=False):
+    """Return a function that turns the text of a field (or None if it's
+    missing) into a key, per the rest of `keySpec`. Missing fields sort as ""
+    (or 0.0 if numeric). If `binary`, the text and key are bytes.
+    """
+    start, end = keySpec.start, keySpec.end
+    if (keySpec.numeric):
+        sign = -1.0 if (keySpec.descending) else 1.0
+        def convertNumeric(text):
+            try:
+                return sign * float(text[start:end])
+            except (TypeError, ValueError):
+                return 0.0
+        return convertNumeric
+    ignoreCase = keySpec.ignoreCase
+    wrapper = Descending if (keySpec.descending) else None
+    empty = b"" if (binary) else ""
+    if (binary):
+        def fold(text): return text.translate(CASE_FOLD)
     else:
-        recs.sort(key=getKeyString, reverse=args.reverse)
+        def fold(text): return text.lower()
+    def convertString(text):
+        if (text is None): text = empty
+        key = text[start:end]
+        if (ignoreCase): key = fold(key)
+        return wrapper(key) if (wrapper) else key
+    return convertString
+
+# For --bytes --ignoreCase (only ASCII letters, since other UTF-8 characters
+# take more than one byte).
+CASE_FOLD = bytes.maketrans(b"ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+    b"abcdefghijklmnopqrstuvwxyz")
+
+def makeKeyFunction(keySpecs, delim="\t", binary=False):
+    """Return a function to get the sort key from a record, per the list of
+    KeySpecs. For a single key, that's just the key; for several, it's a
+    tuple, and the record is split into fields only once. If `binary`, the
+    records, `delim`, and keys are all bytes.
+    """
+    if (len(keySpecs) == 1):
+        getField = makeFieldGetter(keySpecs[0].field, delim, binary)
+        convert = makeConverter(keySpecs[0], binary)
+        def getKey(rec):
+            try:
+                return convert(getField(rec))
+            except IndexError:
+                return convert(None)
+        return getKey
+
+    fields = [ k.field for k in keySpecs if (k.field is not None) ]
+    maxField = -1 if (not fields or min(fields) < 0) else max(fields)
+    split = makeSplitter(delim, maxField)
+    parts = [ (k.field, makeConverter(k, binary)) for k in keySpecs ]
+    eol = b"\r\n" if (binary) else "\r\n"
+    def getKeys(rec):
+        rec = rec.rstrip(eol)
+        fields = split(rec)
+        nFields = len(fields)
+        keys = []
+        for field, convert in parts:
+            if (field is None): keys.append(convert(rec))
+            elif (-nFields <= field < nFields):
+                keys.append(convert(fields[field]))
+            else: keys.append(convert(None))
+        return tuple(keys)
+    return getKeys
+
+def sortRecords(recs, key, reverse=False, numeric=False):
+    """Sort the list `recs` in place (stably). The keys are made once each,
+    in a single pass. If they're `numeric` and NumPy is available, sort them
+    with a (stable) NumPy argsort, and just reorder `recs` to match.
+    """
+    if (numeric and len(recs) > 1):
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        if (numpy is not None):
+            keys = numpy.fromiter(map(key, recs), dtype=float, count=len(recs))
+            if (reverse): keys = -keys  # (stable, unlike reversing the order)
+            order = numpy.argsort(keys, kind="stable")
+            recs[:] = [ recs[i] for i in order.tolist() ]
+            return
+    recs.sort(key=key, reverse=reverse)
 
-    for r in recs:
-        print(r, end=None)
-    return
 
-def getKeyNumeric(rec):
-    fields = re.split(args.delim, rec)
+###############################################################################
+# External merge sort: sort memory-sized batches, spill all but the last to
+# temporary files ("runs"), and merge the runs. heapq.merge() takes the first
+# of equal items from the earliest run, and the runs are in input order, so
+# this is stable, just like list.sort().
+#
+RECORD_OVERHEAD = 100  # Rough bytes per record besides its text (str, key...)
+MAX_FAN_IN = 64        # Most runs to merge at once (each is an open file)
+
+def sortFile(fh, ofh, key, reverse=False, numeric=False, memory=512<<20,
+    tempDir=None, maxFanIn=MAX_FAN_IN, binary=False):
+    """Sort the records (lines) read from `fh`, writing them to `ofh`, using
+    about `memory` bytes at a time (see readBatches()). If `binary`, the
+    files are binary, and the records are bytes.
+    """
+    runs = []
+    tempPaths = []  # Every temporary file, to be sure they all get deleted
+    try:
+        batches = readBatches(fh, memory, binary)
+        batch = next(batches, [])
+        for nextBatch in batches:
+            sortRecords(batch, key, reverse=reverse, numeric=numeric)
+            runs.append(writeRun(batch, tempDir, binary))
+            tempPaths.append(runs[-1])
+            lg.vMsg(2, "Wrote run %d (%d records)." % (len(runs), len(batch)))
+            batch = nextBatch
+        sortRecords(batch, key, reverse=reverse, numeric=numeric)
+        if (not runs):
+            ofh.writelines(batch)
+            return
+        mergeRuns(runs, ofh, key, reverse=reverse, tempDir=tempDir,
+            tempPaths=tempPaths, lastBatch=batch, maxFanIn=maxFanIn,
+            binary=binary)
+    finally:
+        for path in tempPaths:
+            if (os.path.exists(path)): os.remove(path)
+
+def mergeRuns(runs, ofh, key, reverse=False, tempDir=None, tempPaths=None,
+    lastBatch=None, maxFanIn=MAX_FAN_IN, binary=False):
+    """Merge the sorted runs at the paths `runs`, and then the sorted list
+    `lastBatch` if given, writing the result to `ofh`. Any new temporary
+    files are added to `tempPaths`.
+    """
+    if (tempPaths is None): tempPaths = []
+    extra = 0 if (lastBatch is None) else 1
+    while (len(runs) + extra > maxFanIn):
+        # Merge each group of adjacent runs, keeping them in input order.
+        merged = []
+        for i in range(0, len(runs), maxFanIn):
+            group = runs[i:i+maxFanIn]
+            if (len(group) > 1):
+                lg.vMsg(2, "Merging %d runs." % (len(group)))
+                tempPaths.append(
+                    mergeToRun(group, key, reverse, tempDir, binary))
+                for path in group: os.remove(path)
+                group = tempPaths[-1:]
+            merged.extend(group)
+        runs = merged
+    lg.vMsg(2, "Merging %d runs." % (len(runs) + extra))
+    runFiles = [ openRun(path, binary) for path in runs ]
+    if (lastBatch is not None): runFiles.append(iter(lastBatch))
     try:
-        return float(fields[args.field])
-    except IndexError:
-        return 0.0
+        ofh.writelines(heapq.merge(*runFiles, key=key, reverse=reverse))
+    finally:
+        for rfh in runFiles[:len(runs)]: rfh.close()
+
+def readBatches(fh, memory, binary=False):
+    """Generate lists of records from `fh`, each taking about `memory` bytes.
+    Every record ends up ending with a line-break.
+    """
+    nl = b"\n" if (binary) else "\n"
+    batch = []
+    size = 0
+    for rec in fh:
+        if (rec[-1:] != nl): rec += nl
+        batch.append(rec)
+        size += len(rec) + RECORD_OVERHEAD
+        if (size >= memory):
+            yield batch
+            batch = []
+            size = 0
+    if (batch): yield batch
+
+def writeRun(recs, tempDir=None, binary=False):
+    """Write a run (already sorted) to a new temporary file; return its path.
+    """
+    fd, path = tempfile.mkstemp(prefix="sort-", suffix=".run", dir=tempDir)
+    if (binary):
+        with open(fd, "wb") as rfh:
+            rfh.writelines(recs)
+    else:
+        with open(fd, "w", encoding="utf-8", newline="\n") as rfh:
+            rfh.writelines(recs)
+    return path
+
+def openRun(path, binary=False):
+    if (binary): return open(path, "rb", buffering=1<<16)
+    return open(path, "r", encoding="utf-8", newline="\n", buffering=1<<16)
 
-def getKeyString(rec):
-    fields = re.split(args.delim, rec)
+def mergeToRun(paths, key, reverse=False, tempDir=None, binary=False):
+    """Merge the runs at `paths` into one new run; return its path.
+    """
+    runFiles = [ openRun(path, binary) for path in paths ]
     try:
-        return "_" + fields[args.field]
-    except IndexError:
-        return '_'
+        return writeRun(heapq.merge(*runFiles, key=key, reverse=reverse),
+            tempDir, binary)
+    finally:
+        for rfh in runFiles: rfh.close()
+
+
+###############################################################################
+# Parallel sorting (--parallel N). The file is cut into byte ranges at line
+# boundaries, and each worker process reads its own range straight from the
+# file, sorts it, and writes it as a run; so all that passes between processes
+# is offsets and run paths. STDIN can't be read that way, so it's read in
+# blocks, which are passed to the workers as bytes. Then the runs are merged
+# as in sortFile(). Input must be in an encoding (like UTF-8) where a newline
+# byte is always a newline.
+#
+CHUNK_EXPANSION = 3  # Roughly how much more memory a chunk takes once sorted
 
-def getKeyLower(rec):
-    fields = re.split(args.delim, rec)
+def sortFileParallel(path, ofh, nProcs, reverse=False, memory=512<<20,
+    tempDir=None, maxFanIn=MAX_FAN_IN, binary=False):
+    """Sort the file at `path` (or STDIN if it's None) to `ofh`, using a pool
+    of `nProcs` processes, each sorting about `memory`/`nProcs` at a time.
+    """
+    chunkBytes = max(1, memory // (nProcs * CHUNK_EXPANSION))
+    runDir = tempfile.mkdtemp(prefix="sort-", dir=tempDir)
+    methods = multiprocessing.get_all_start_methods()
+    ctx = multiprocessing.get_context("fork" if "fork" in methods else None)
     try:
-        return "_" + fields[args.field].tolower()
-    except IndexError:
-        return '_'
+        with ctx.Pool(nProcs, initializer=_initWorker,
+            initargs=(args,)) as pool:
+            if (path is None):
+                runs = []
+                blocks = readBlocks(sys.stdin.buffer, chunkBytes)
+                while (True):  # A few at a time, so STDIN isn't all in memory
+                    wave = [ (None, 0, 0, block, runDir)
+                        for block in itertools.islice(blocks, nProcs) ]
+                    if (not wave): break
+                    runs.extend(pool.map(sortChunk, wave))
+            else:
+                size = os.path.getsize(path)
+                nChunks = max(nProcs, -(-size // chunkBytes))
+                runs = pool.map(sortChunk, [ (path, start, end, None, runDir)
+                    for start, end in chunkRanges(path, nChunks) ])
+        runs = [ run for run in runs if (run) ]
+        lg.vMsg(2, "Sorted %d chunks." % (len(runs)))
+        mergeRuns(runs, ofh, getKeyFunction(), reverse=reverse, tempDir=runDir,
+            maxFanIn=maxFanIn, binary=binary)
+    finally:
+        shutil.rmtree(runDir, ignore_errors=True)
+
+def chunkRanges(path, nChunks):
+    """Return a list of about `nChunks` (start, end) byte offsets that cover
+    the file, each starting at the start of a line.
+    """
+    size = os.path.getsize(path)
+    bounds = [ 0 ]
+    with open(path, "rb") as fh:
+        for i in range(1, nChunks):
+            fh.seek(max(size * i // nChunks - 1, bounds[-1]))
+            fh.readline()
+            if (bounds[-1] < fh.tell() < size): bounds.append(fh.tell())
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def readBlocks(fh, blockBytes):
+    """Generate blocks of about `blockBytes` from the binary file `fh`, each
+    ending at the end of a line.
+    """
+    while (True):
+        block = fh.read(blockBytes)
+        if (not block): return
+        if (not block.endswith(b"\n")): block += fh.readline()
+        yield block
+
+def _initWorker(args0):
+    global args
+    args = args0
+
+def sortChunk(job):
+    """In a worker: sort one chunk, given as (path, start, end, data, runDir),
+    where the chunk is either bytes `start` to `end` of the file at `path`, or
+    else the bytes `data`. Write it as a run in `runDir`, and return its path
+    (or None if there were no records).
+    """
+    path, start, end, data, runDir = job
+    if (data is None):
+        with open(path, "rb") as fh:
+            fh.seek(start)
+            data = fh.read(end - start)
+    if (args.bytes):
+        recs = data.split(b"\n")
+    else:
+        recs = data.decode(args.iencoding).split("\n")
+    del data
+    if (not recs[-1]): recs.pop()
+    if (not recs): return None
+    nl = b"\n" if (args.bytes) else "\n"
+    recs = [ rec + nl for rec in recs ]
+    sortRecords(recs, getKeyFunction(), reverse=args.reverse,
+        numeric=isNumericKey(args.keySpecs))
+    return writeRun(recs, runDir, args.bytes)
 
 
 ###############################################################################
 # Main
 #
-args = processOptions()
-
-if (len(args.files) == 0):
-    lg.error("No files specified....")
-    doOneFile("[STDIN]", sys.stdin.readlines)
-else:
-    for fArg in (args.files):
-        fh = codecs.open(fArg, 'rb', encoding=args.iencoding)
-        doOneFile(fArg, fh)
-        fh.close()
-
-if (not args.quiet):
-    lg.vMsg(0,"Done.")
-    lg.showStats()
+if __name__ == "__main__":
+    args = processOptions()
+
+    if (len(args.files) == 0):
+        lg.error("No files specified....")
+        doOneFile("[STDIN]", sys.stdin.buffer if (args.bytes) else sys.stdin)
+    else:
+        for fArg in (args.files):
+            if (args.bytes):
+                fh = open(fArg, "rb")
+            else:
+                fh = open(fArg, "r", encoding=args.iencoding, newline="\n")
+            doOneFile(fArg, fh)
+            fh.close()
+
+    if (not args.quiet):
+        lg.vMsg(0,"Done.")
+        lg.showStats()